@@ -0,0 +1,248 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Set, Tuple
+
+class AdmissionError(Exception):
+    """Raised when a request is rejected; carries the HTTP status and Retry-After seconds"""
+
+    def __init__(self, status_code: int, error: str, message: str, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.error = error
+        self.message = message
+        self.retry_after = retry_after
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> Tuple[bool, float]:
+        """Take tokens if available; otherwise return seconds until they will be"""
+        self.refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True, 0.0
+        return False, (tokens - self.tokens) / self.rate
+
+class AdmissionController:
+    def __init__(self):
+        self.rate_per_minute = float(os.getenv("RATE_LIMIT_PER_MINUTE", "30"))
+        self.burst = float(os.getenv("RATE_LIMIT_BURST", "10"))
+        self.max_streams_per_client = int(os.getenv("MAX_STREAMS_PER_CLIENT", "3"))
+        self.max_active_streams = int(os.getenv("MAX_ACTIVE_STREAMS", "200"))
+        self.max_queue_wait_ms = float(os.getenv("MAX_QUEUE_WAIT_MS", "1000"))
+        self.max_stream_wait_ms = float(os.getenv("MAX_STREAM_WAIT_MS", "2000"))
+        self.max_loop_lag_ms = float(os.getenv("MAX_LOOP_LAG_MS", "250"))
+        # Queue-wait shedding needs evidence from several clients, not just one
+        self.min_wait_clients = int(os.getenv("MIN_WAIT_CLIENTS", "2"))
+        self.lag_interval = 0.1
+        self.window_seconds = 30.0
+
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.streams: Dict[str, int] = {}
+        self.active_streams = 0
+        # Streams queued for a global slot, oldest first; a freed slot goes straight to the head
+        self.slot_waiters: Deque[asyncio.Future] = deque()
+        # (recorded at, client key, ms spent waiting for a global stream slot)
+        self.queue_waits: Deque[Tuple[float, str, float]] = deque()
+        self.loop_lag_ms = 0.0
+        self.rejected = {"rate_limited": 0, "too_many_streams": 0, "overloaded": 0}
+        self.last_cleanup = time.monotonic()
+
+    def check_request(self, client_key: str):
+        """Admit a new chat job or raise AdmissionError (503 when shedding, 429 when over the rate)"""
+        self.check_load()
+
+        bucket = self.buckets.get(client_key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate_per_minute / 60.0, self.burst)
+            self.buckets[client_key] = bucket
+
+        allowed, wait = bucket.try_acquire()
+        if not allowed:
+            self.rejected["rate_limited"] += 1
+            raise AdmissionError(
+                429, "rate_limited", "Too many requests, slow down", math.ceil(wait)
+            )
+
+        self.cleanup_idle_clients()
+
+    def check_load(self):
+        """Shed new work while queue wait or event-loop lag is above its limit"""
+        queue_wait_ms = self.get_queue_wait_ms()
+        if queue_wait_ms > self.max_queue_wait_ms or self.loop_lag_ms > self.max_loop_lag_ms:
+            self.rejected["overloaded"] += 1
+            # Ask clients to come back after roughly the time it takes the backlog to clear
+            retry_after = max(1, min(30, math.ceil(max(queue_wait_ms, self.loop_lag_ms) / 1000)))
+            raise AdmissionError(
+                503, "overloaded", "Server is busy, please retry shortly", retry_after
+            )
+
+    async def acquire_stream(self, client_key: str) -> "StreamSlot":
+        """
+        Reserve a stream slot for the client. Over the per-client cap this
+        fails at once (429); when every global slot is busy it queues for up
+        to MAX_STREAM_WAIT_MS before failing (503).
+        """
+        if self.streams.get(client_key, 0) >= self.max_streams_per_client:
+            self.rejected["too_many_streams"] += 1
+            raise AdmissionError(
+                429, "too_many_streams",
+                f"At most {self.max_streams_per_client} concurrent streams per client", 1
+            )
+        self.streams[client_key] = self.streams.get(client_key, 0) + 1
+
+        start = time.monotonic()
+        try:
+            if self.active_streams < self.max_active_streams and not self.slot_waiters:
+                self.active_streams += 1
+            else:
+                await self.wait_for_slot()
+        except BaseException as e:
+            self.release_client(client_key)
+            if isinstance(e, AdmissionError):
+                self.rejected["overloaded"] += 1
+            raise
+        finally:
+            self.record_queue_wait(client_key, (time.monotonic() - start) * 1000)
+
+        return StreamSlot(self, client_key)
+
+    def release_client(self, client_key: str):
+        count = self.streams.get(client_key, 0)
+        if count <= 1:
+            self.streams.pop(client_key, None)
+        else:
+            self.streams[client_key] = count - 1
+
+    async def wait_for_slot(self):
+        """Queue behind earlier waiters until a slot is handed over, or fail with 503"""
+        waiter = asyncio.get_running_loop().create_future()
+        self.slot_waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.max_stream_wait_ms / 1000)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot arrived as we gave up; pass it on rather than lose it
+                self.release_slot()
+            elif waiter in self.slot_waiters:
+                self.slot_waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise AdmissionError(503, "overloaded", "Server is busy, please retry shortly", 2) from None
+            raise
+
+    def release_slot(self):
+        """Hand a global slot to the oldest queued stream, or free it if nobody is waiting"""
+        while self.slot_waiters:
+            waiter = self.slot_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active_streams = max(0, self.active_streams - 1)
+
+    def release_stream(self, client_key: str):
+        """Release a slot taken by acquire_stream"""
+        self.release_client(client_key)
+        self.release_slot()
+
+    def record_queue_wait(self, client_key: str, wait_ms: float):
+        """Record time a stream spent queued for a global slot"""
+        self.queue_waits.append((time.monotonic(), client_key, min(wait_ms, self.max_stream_wait_ms)))
+
+    def get_queue_wait_ms(self) -> float:
+        """
+        90th percentile of each client's worst recent slot wait. Returns 0
+        until enough distinct clients have reported, so one client can't
+        trigger shedding for everyone.
+        """
+        cutoff = time.monotonic() - self.window_seconds
+        while self.queue_waits and self.queue_waits[0][0] < cutoff:
+            self.queue_waits.popleft()
+
+        per_client: Dict[str, float] = {}
+        for _, client_key, wait in self.queue_waits:
+            per_client[client_key] = max(wait, per_client.get(client_key, 0.0))
+        if len(per_client) < self.min_wait_clients:
+            return 0.0
+
+        ordered = sorted(per_client.values())
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+
+    async def monitor_loop_lag(self):
+        """Measure how late the event loop wakes a sleeping task"""
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.lag_interval)
+            lag_ms = max(0.0, (time.perf_counter() - start - self.lag_interval) * 1000)
+            # Smooth so a single slow tick doesn't trigger shedding
+            self.loop_lag_ms = self.loop_lag_ms * 0.7 + lag_ms * 0.3
+
+    def cleanup_idle_clients(self):
+        """Drop buckets that have refilled completely so the table doesn't grow without bound"""
+        now = time.monotonic()
+        if now - self.last_cleanup < 60:
+            return
+        self.last_cleanup = now
+
+        to_remove = []
+        for client_key, bucket in self.buckets.items():
+            bucket.refill()
+            if bucket.tokens >= bucket.capacity and client_key not in self.streams:
+                to_remove.append(client_key)
+
+        for client_key in to_remove:
+            del self.buckets[client_key]
+
+    def get_stats(self) -> Dict:
+        return {
+            "active_streams": self.active_streams,
+            "clients": len(self.buckets),
+            "queue_wait_ms": round(self.get_queue_wait_ms(), 1),
+            "loop_lag_ms": round(self.loop_lag_ms, 1),
+            "rejected": dict(self.rejected)
+        }
+
+class StreamSlot:
+    """A reserved stream slot; release() is safe to call more than once"""
+
+    def __init__(self, controller: AdmissionController, client_key: str):
+        self.controller = controller
+        self.client_key = client_key
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller.release_stream(self.client_key)
+
+def parse_list(value: Optional[str]) -> Set[str]:
+    return {item.strip() for item in (value or "").split(",") if item.strip()}
+
+# Proxies allowed to name the client, and keys issued to clients
+TRUSTED_PROXIES = parse_list(os.getenv("TRUSTED_PROXIES"))
+CLIENT_KEYS = parse_list(os.getenv("CLIENT_KEYS"))
+
+def get_client_key(headers, client_host: Optional[str]) -> str:
+    """
+    Identify a client by its peer address. X-Client-Key is honoured only
+    when it is an issued key (CLIENT_KEYS) or the peer is a trusted proxy,
+    so clients can't mint fresh identities to dodge their limits.
+    """
+    client_key = headers.get("x-client-key")
+    if client_key and (client_key in CLIENT_KEYS or client_host in TRUSTED_PROXIES):
+        return f"key:{client_key}"
+    return client_host or "unknown"
+
+# Global instance
+admission_controller = AdmissionController()
@@ -0,0 +1,97 @@
+"""
+Compare PDF extraction backends on a directory of PDFs.
+
+    python bench_extraction.py [pdf_directory] [--json results.json]
+
+Reports pages/sec for each backend, how closely its text agrees with
+pdfplumber (the reference), and how many pages the default pipeline
+would send to the fallback backend.
+"""
+import argparse
+import difflib
+import json
+import os
+import time
+from typing import Dict, List
+
+from pdf_processor import BACKENDS, page_quality_issue
+
+REFERENCE_BACKEND = "pdfplumber"
+
+def text_agreement(text: str, reference: str) -> float:
+    """Word-level similarity in [0, 1], ignoring layout whitespace"""
+    words = text.split()
+    reference_words = reference.split()
+    if not words and not reference_words:
+        return 1.0
+    return difflib.SequenceMatcher(None, words, reference_words, autojunk=False).ratio()
+
+def run_benchmark(pdf_directory: str) -> Dict:
+    pdf_paths = sorted(
+        os.path.join(pdf_directory, filename)
+        for filename in os.listdir(pdf_directory)
+        if filename.endswith(".pdf")
+    )
+    backends = [backend for backend in BACKENDS.values() if backend.is_available()]
+
+    extracted: Dict[str, Dict[str, List[Dict]]] = {}
+    results: Dict[str, Dict] = {}
+
+    for backend in backends:
+        extracted[backend.name] = {}
+        total_pages = 0
+        start = time.perf_counter()
+        for pdf_path in pdf_paths:
+            pages = backend.extract_pages(pdf_path)
+            extracted[backend.name][pdf_path] = pages
+            total_pages += len(pages)
+        elapsed = time.perf_counter() - start
+
+        results[backend.name] = {
+            "pages": total_pages,
+            "seconds": round(elapsed, 3),
+            "pages_per_sec": round(total_pages / elapsed, 1) if elapsed else None,
+            "fallback_pages": sum(
+                1
+                for pages in extracted[backend.name].values()
+                for page in pages
+                if page_quality_issue(page["text"])
+            )
+        }
+
+    if REFERENCE_BACKEND in extracted:
+        reference = extracted[REFERENCE_BACKEND]
+        for backend in backends:
+            scores = [
+                text_agreement(page["text"], reference_page["text"])
+                for pdf_path in pdf_paths
+                for page, reference_page in zip(extracted[backend.name][pdf_path], reference[pdf_path])
+            ]
+            results[backend.name]["agreement"] = round(sum(scores) / len(scores), 4) if scores else None
+            results[backend.name]["min_agreement"] = round(min(scores), 4) if scores else None
+
+    return {"pdf_directory": pdf_directory, "documents": len(pdf_paths), "backends": results}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf_directory", nargs="?", default="sample_pdfs")
+    parser.add_argument("--json", dest="json_path", help="Also write results to this file")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.pdf_directory)
+
+    print(f"{report['documents']} documents in {report['pdf_directory']}")
+    print(f"{'backend':<12} {'pages':>6} {'pages/sec':>10} {'agreement':>10} {'min':>7} {'fallback':>9}")
+    for name, result in report["backends"].items():
+        print(
+            f"{name:<12} {result['pages']:>6} {result['pages_per_sec'] or 0:>10} "
+            f"{result.get('agreement', '-'):>10} {result.get('min_agreement', '-'):>7} "
+            f"{result['fallback_pages']:>9}"
+        )
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+from typing import Dict, List, Optional
+from datetime import datetime
+import asyncio
+import os
+from pdf_processor import pdf_processor
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token)"""
+    return max(1, len(text) // 4)
+
+def summarize_text(text: str, max_chars: int) -> str:
+    """Shorten text to its leading sentences within max_chars"""
+    text = " ".join(text.split())
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    sentence_end = cut.rfind(". ")
+    if sentence_end > max_chars // 2:
+        cut = cut[:sentence_end + 1]
+    return cut.rstrip() + "..."
+
+class ConversationStore:
+    def __init__(
+        self,
+        max_history_tokens: int = 1500,
+        max_context_tokens: int = 6000,
+        top_k: int = 5,
+        summary_chars: int = 300
+    ):
+        self.conversations: Dict[str, Dict] = {}
+        self.max_history_tokens = max_history_tokens
+        self.max_context_tokens = max_context_tokens
+        self.top_k = top_k
+        self.summary_chars = summary_chars
+        self.max_age_seconds = int(os.getenv("CONVERSATION_TTL_SECONDS", "3600"))
+
+    def detached(self) -> "ConversationStore":
+        """An empty store with the same budgets, for one-off calls that shouldn't be remembered"""
+        return ConversationStore(
+            self.max_history_tokens,
+            self.max_context_tokens,
+            self.top_k,
+            self.summary_chars
+        )
+
+    def get_or_create(self, conversation_id: str) -> Dict:
+        """Get conversation by ID, creating it on first use"""
+        conversation = self.conversations.get(conversation_id)
+        if conversation is None:
+            conversation = {
+                "conversation_id": conversation_id,
+                "turns": [],
+                # Citation number -> chunk; numbering is stable for the whole conversation
+                "chunks": {},
+                "chunk_ids": {},
+                "last_citations": [],
+                "created_at": datetime.now(),
+                "updated_at": datetime.now()
+            }
+            self.conversations[conversation_id] = conversation
+        return conversation
+
+    def get_conversation(self, conversation_id: str) -> Optional[Dict]:
+        """Get conversation by ID"""
+        return self.conversations.get(conversation_id)
+
+    def add_chunks(self, conversation_id: str, chunks: List[Dict]) -> List[int]:
+        """
+        Register retrieved chunks and return their citation numbers.
+        Chunks already seen in this conversation keep their number.
+        """
+        conversation = self.get_or_create(conversation_id)
+        citation_ids = []
+
+        for chunk in chunks:
+            citation_id = conversation["chunk_ids"].get(chunk["chunk_id"])
+            if citation_id is None:
+                citation_id = len(conversation["chunks"]) + 1
+                conversation["chunk_ids"][chunk["chunk_id"]] = citation_id
+                conversation["chunks"][citation_id] = {**chunk, "citation_id": citation_id}
+            citation_ids.append(citation_id)
+
+        return citation_ids
+
+    def prepare_turn(
+        self,
+        conversation_id: str,
+        query: str,
+        available_documents: List[str]
+    ) -> Dict:
+        """
+        Retrieve context for a new turn, reusing the conversation's chunks.
+
+        Returns the chunks to put in the prompt, every chunk the answer may
+        cite (keyed by citation number), and the prior turns as messages.
+        """
+        conversation = self.get_or_create(conversation_id)
+        known_before = len(conversation["chunks"])
+
+        retrieved = pdf_processor.retrieve_chunks(query, available_documents, self.top_k)
+        citation_ids = self.add_chunks(conversation_id, retrieved)
+
+        if not citation_ids:
+            if conversation["last_citations"]:
+                # Follow-up without new search terms ("tell me more"): reuse last context
+                citation_ids = list(conversation["last_citations"])
+            else:
+                leading = pdf_processor.leading_chunks(available_documents)
+                citation_ids = self.add_chunks(conversation_id, leading[:self.top_k])
+
+        conversation["last_citations"] = citation_ids
+
+        # Chunks cited in earlier answers stay available if the budget allows
+        candidates = list(citation_ids)
+        for turn in reversed(conversation["turns"]):
+            for citation_id in turn["citations"]:
+                if citation_id not in candidates:
+                    candidates.append(citation_id)
+
+        context = []
+        used_tokens = 0
+        for citation_id in candidates:
+            chunk = conversation["chunks"][citation_id]
+            tokens = estimate_tokens(chunk["content"])
+            if context and used_tokens + tokens > self.max_context_tokens:
+                continue
+            context.append(chunk)
+            used_tokens += tokens
+
+        context.sort(key=lambda chunk: chunk["citation_id"])
+
+        return {
+            "context": context,
+            "chunks": dict(conversation["chunks"]),
+            "history": self.history_messages(conversation_id),
+            "new_chunks": len(conversation["chunks"]) - known_before
+        }
+
+    def history_messages(self, conversation_id: str) -> List[Dict]:
+        """
+        Prior turns as chat messages within the history token budget.
+        Recent turns are kept whole; older ones are summarized or dropped.
+        """
+        conversation = self.conversations.get(conversation_id)
+        if not conversation:
+            return []
+
+        messages: List[Dict] = []
+        used_tokens = 0
+
+        for turn in reversed(conversation["turns"]):
+            answer = turn["answer"]
+            tokens = estimate_tokens(turn["query"]) + estimate_tokens(answer)
+
+            if used_tokens + tokens > self.max_history_tokens:
+                answer = summarize_text(answer, self.summary_chars)
+                tokens = estimate_tokens(turn["query"]) + estimate_tokens(answer)
+                if used_tokens + tokens > self.max_history_tokens:
+                    break
+
+            messages[:0] = [
+                {"role": "user", "content": turn["query"]},
+                {"role": "assistant", "content": answer}
+            ]
+            used_tokens += tokens
+
+        return messages
+
+    def add_turn(
+        self,
+        conversation_id: str,
+        query: str,
+        answer: str,
+        citations: List[int]
+    ):
+        """Record a completed question/answer turn"""
+        conversation = self.get_or_create(conversation_id)
+        conversation["turns"].append({
+            "query": query,
+            "answer": answer,
+            "citations": list(citations),
+            "created_at": datetime.now()
+        })
+        conversation["updated_at"] = datetime.now()
+
+    def cleanup_old_conversations(self, max_age_seconds: int = 3600):
+        """Remove conversations idle for longer than max_age_seconds"""
+        now = datetime.now()
+        to_remove = []
+
+        for conversation_id, conversation in self.conversations.items():
+            age = (now - conversation["updated_at"]).total_seconds()
+            if age > max_age_seconds:
+                to_remove.append(conversation_id)
+
+        for conversation_id in to_remove:
+            del self.conversations[conversation_id]
+
+    async def cleanup_loop(self, interval: float = 60.0):
+        """Expire idle conversations periodically; run as a background task"""
+        while True:
+            await asyncio.sleep(interval)
+            self.cleanup_old_conversations(self.max_age_seconds)
+
+# Global instance
+conversation_store = ConversationStore()
@@ -0,0 +1,42 @@
+"""
+Rebuild the evaluation PDFs in eval/corpus/ from eval/corpus.json.
+
+    python eval/build_corpus.py
+
+The PDFs are checked in; only rerun this after editing corpus.json
+(and update cases.json and the baselines to match).
+"""
+import json
+import os
+import textwrap
+
+import pymupdf
+
+EVAL_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_DIR = os.path.join(EVAL_DIR, "corpus")
+
+def build_pdf(pages, pdf_path: str):
+    doc = pymupdf.open()
+    for page_text in pages:
+        page = doc.new_page()
+        lines = []
+        for paragraph in page_text.split("\n"):
+            lines.extend(textwrap.wrap(paragraph, 85) or [""])
+        page.insert_text((72, 72), "\n".join(lines), fontsize=11)
+    # Fixed metadata and no compression randomness keep rebuilds byte-stable
+    doc.set_metadata({"producer": "eval corpus", "creationDate": "", "modDate": ""})
+    doc.save(pdf_path, garbage=4, deflate=True, no_new_id=True)
+    doc.close()
+
+def main():
+    with open(os.path.join(EVAL_DIR, "corpus.json"), encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    os.makedirs(CORPUS_DIR, exist_ok=True)
+    for document_id, pages in corpus.items():
+        pdf_path = os.path.join(CORPUS_DIR, f"{document_id}.pdf")
+        build_pdf(pages, pdf_path)
+        print(f"Wrote {pdf_path} ({len(pages)} pages)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+Offline answer-quality and latency regression suite.
+
+    python eval_pipeline.py [--output eval/baselines/new.json] [--compare eval/baselines/baseline.json]
+                            [--latency-tolerance 25]
+
+Runs the checked-in corpus (eval/corpus) and question set (eval/cases.json)
+through retrieval, prompt packing, streaming and citation resolution, with a
+deterministic local provider in place of the LLM. Reports retrieval recall@k,
+citation page/span accuracy, ingestion pages/sec, retrieval p99 and
+end-to-end latency as JSON that can be diffed against a stored baseline.
+Quality metrics are exact and reproducible, so any drop fails the comparison.
+Latencies depend on the machine; they only fail it when --latency-tolerance
+is given and they move the wrong way by more than that many percent.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import re
+import shutil
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional
+
+from pdf_processor import PDFProcessor, pdf_processor, tokenize
+from conversation_store import conversation_store
+from grok_client import GroqClient
+from models import CitationEvent, ErrorEvent, TextEvent, decode_event, encode_event
+
+EVAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eval")
+CORPUS_DIR = os.path.join(EVAL_DIR, "corpus")
+CASES_PATH = os.path.join(EVAL_DIR, "cases.json")
+REPORT_VERSION = 1
+
+# Metrics where a lower value than the baseline is a regression
+QUALITY_METRICS = ["recall_at_1", "recall_at_k", "citation_page_accuracy", "citation_span_accuracy"]
+
+# Latency metrics gated by --latency-tolerance, and whether higher is better
+LATENCY_METRICS = {"ingestion_pages_per_sec": True, "retrieval_p99_ms": False, "e2e_p99_ms": False}
+
+class FakeCompletions:
+    """
+    Stands in for the OpenAI chat completions API. Answers with the
+    excerpt sentence sharing the most terms with the question and cites
+    that excerpt's number, streamed a few words at a time.
+    """
+
+    def create(self, model: str, messages: List[Dict], stream: bool = True, **kwargs) -> Iterator:
+        prompt = messages[-1]["content"]
+        question_match = re.search(r"User Question: (.*)\n", prompt)
+        question_terms = set(tokenize(question_match.group(1) if question_match else ""))
+
+        best = None
+        excerpts = re.findall(
+            r"^\[(\d+)\] Document: .*?\nContent:\n(.*?)(?=\n\n\[\d+\] Document: |\n\nUser Question: )",
+            prompt,
+            re.DOTALL | re.MULTILINE
+        )
+        for citation_id, content in excerpts:
+            for sentence in re.split(r"(?<=[.!?])\s+", " ".join(content.split())):
+                score = len(question_terms & set(tokenize(sentence)))
+                if score and (best is None or score > best[0]):
+                    best = (score, sentence, citation_id)
+
+        if best is None:
+            answer = "The documents don't contain relevant information."
+        else:
+            answer = f"{best[1].rstrip('.')} [{best[2]}]."
+
+        words = answer.split(" ")
+        for i in range(0, len(words), 3):
+            delta = " ".join(words[i:i + 3]) + (" " if i + 3 < len(words) else "")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+
+class FakeGroqClient(GroqClient):
+    """GroqClient wired to FakeCompletions; no API key or network needed"""
+
+    def __init__(self):
+        self.api_key = None
+        self.model = "fake-deterministic"
+        self._client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def measure_ingestion(document_ids: List[str], repeats: int) -> Dict:
+    """Parse the corpus from scratch (no index) and time it"""
+    pages = 0
+    elapsed = 0.0
+    for _ in range(repeats):
+        with tempfile.TemporaryDirectory() as index_dir:
+            processor = PDFProcessor(CORPUS_DIR, index_directory=index_dir)
+            start = time.perf_counter()
+            for doc_id in document_ids:
+                pages += processor.load_pdf(doc_id)["num_pages"]
+            elapsed += time.perf_counter() - start
+    return {
+        "pages": pages,
+        "seconds": round(elapsed, 4),
+        "pages_per_sec": round(pages / elapsed, 1) if elapsed else None
+    }
+
+async def run_case(client: GroqClient, case: Dict, document_ids: List[str]) -> Dict:
+    """Run one question through the full streaming pipeline"""
+    citations = []
+    answer = ""
+    start = time.perf_counter()
+    # The client logs debug lines on every request
+    with contextlib.redirect_stdout(io.StringIO()):
+        async for event in client.generate_response_stream(
+            case["question"], document_ids
+        ):
+            # Round-trip through the wire format so contract breaks fail the run
+            event = decode_event(encode_event(event))
+            if isinstance(event, TextEvent):
+                answer += event.data.delta
+            elif isinstance(event, CitationEvent):
+                citations.append(event.data.citation)
+            elif isinstance(event, ErrorEvent):
+                raise RuntimeError(event.data.message)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    first = citations[0] if citations else None
+    page_ok = bool(first) and (
+        first.documentId == case["document_id"] and first.pageNumber == case["expected_page"]
+    )
+    span_ok = bool(first) and normalize(case["expected_span"]) in normalize(first.text)
+
+    return {
+        "answer": answer,
+        "cited": [f"{c.documentId}:{c.pageNumber}" for c in citations],
+        "page_ok": page_ok,
+        "span_ok": span_ok,
+        "e2e_ms": round(elapsed_ms, 3)
+    }
+
+async def run_eval(repeats: int) -> Dict:
+    # Point the shared processor at the eval corpus with a throwaway index
+    index_dir = tempfile.mkdtemp(prefix="eval-index-")
+    try:
+        return await evaluate(index_dir, repeats)
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+async def evaluate(index_dir: str, repeats: int) -> Dict:
+    with open(CASES_PATH, encoding="utf-8") as f:
+        cases = json.load(f)
+
+    pdf_processor.pdf_directory = CORPUS_DIR
+    pdf_processor.index_directory = index_dir
+    pdf_processor.pdf_cache.clear()
+    pdf_processor.term_cache.clear()
+
+    document_ids = sorted(pdf_processor.list_available_pdfs())
+    ingestion = measure_ingestion(document_ids, repeats)
+    pdf_processor.warm_up()
+
+    k = conversation_store.top_k
+    client = FakeGroqClient()
+    retrieval_ms: List[float] = []
+    e2e_ms: List[float] = []
+    results = []
+
+    for case in cases:
+        expected = f"{case['document_id']}:{case['expected_page']}"
+
+        for _ in range(repeats):
+            start = time.perf_counter()
+            chunks = pdf_processor.retrieve_chunks(case["question"], document_ids, k)
+            retrieval_ms.append((time.perf_counter() - start) * 1000)
+        retrieved = [chunk["chunk_id"] for chunk in chunks]
+
+        for _ in range(repeats):
+            outcome = await run_case(client, case, document_ids)
+            e2e_ms.append(outcome["e2e_ms"])
+
+        results.append({
+            "question": case["question"],
+            "expected": expected,
+            "retrieved": retrieved,
+            "hit_at_1": retrieved[:1] == [expected],
+            "hit_at_k": expected in retrieved,
+            "cited": outcome["cited"],
+            "page_ok": outcome["page_ok"],
+            "span_ok": outcome["span_ok"],
+            "answer": outcome["answer"]
+        })
+
+    total = len(results) or 1
+
+    return {
+        "version": REPORT_VERSION,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "extraction_backend": pdf_processor.backend_name
+        },
+        "corpus": {
+            "documents": len(document_ids),
+            "pages": ingestion["pages"] // max(1, repeats),
+            "cases": len(results)
+        },
+        "quality": {
+            "k": k,
+            "recall_at_1": round(sum(r["hit_at_1"] for r in results) / total, 4),
+            "recall_at_k": round(sum(r["hit_at_k"] for r in results) / total, 4),
+            "citation_page_accuracy": round(sum(r["page_ok"] for r in results) / total, 4),
+            "citation_span_accuracy": round(sum(r["span_ok"] for r in results) / total, 4)
+        },
+        "latency": {
+            "repeats": repeats,
+            "ingestion_pages_per_sec": ingestion["pages_per_sec"],
+            "retrieval_p50_ms": round(percentile(retrieval_ms, 50), 4),
+            "retrieval_p99_ms": round(percentile(retrieval_ms, 99), 4),
+            "e2e_p50_ms": round(percentile(e2e_ms, 50), 3),
+            "e2e_p99_ms": round(percentile(e2e_ms, 99), 3)
+        },
+        "cases": results
+    }
+
+def latency_regressed(metric: str, value: float, old: float, tolerance: float) -> bool:
+    """True if a gated latency metric got worse than the baseline by more than tolerance percent"""
+    if old <= 0:
+        return False
+    change = (value - old) / old * 100
+    return -change > tolerance if LATENCY_METRICS[metric] else change > tolerance
+
+def compare(report: Dict, baseline: Dict, latency_tolerance: Optional[float] = None) -> bool:
+    """
+    Print metric changes against a baseline; returns False on a quality
+    regression, or a latency regression beyond latency_tolerance percent
+    """
+    ok = True
+    print(f"\n{'metric':<28} {'baseline':>10} {'current':>10} {'change':>10}")
+    for section in ("quality", "latency"):
+        for metric, value in report[section].items():
+            old = baseline.get(section, {}).get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            flag = ""
+            if metric in QUALITY_METRICS and value < old:
+                flag = "  REGRESSION"
+                ok = False
+            elif (
+                latency_tolerance is not None
+                and metric in LATENCY_METRICS
+                and latency_regressed(metric, value, old, latency_tolerance)
+            ):
+                flag = f"  REGRESSION (>{latency_tolerance:g}%)"
+                ok = False
+            print(f"{metric:<28} {old:>10} {value:>10} {round(value - old, 4):>+10}{flag}")
+
+    baseline_cases = {case["question"]: case for case in baseline.get("cases", [])}
+    for case in report["cases"]:
+        old = baseline_cases.get(case["question"])
+        if old and (old["page_ok"], old["hit_at_k"]) != (case["page_ok"], case["hit_at_k"]):
+            print(f"changed: {case['question']!r} cited {old['cited']} -> {case['cited']}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="Baseline JSON report to diff against")
+    parser.add_argument("--repeats", type=int, default=5, help="Timing repetitions per case")
+    parser.add_argument(
+        "--latency-tolerance",
+        type=float,
+        help="Also fail --compare if ingestion pages/sec drops, or retrieval/e2e p99 rises, by more than this percent"
+    )
+    args = parser.parse_args()
+
+    report = asyncio.run(run_eval(args.repeats))
+
+    print(json.dumps({key: report[key] for key in ("corpus", "quality", "latency")}, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(report, baseline, args.latency_tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 import os
-import google.generativeai as genai
-from typing import AsyncGenerator, Dict, List
-import json
-from models import Citation, SourceCard, ToolCall
+from typing import AsyncGenerator, List
+from models import (
+    Citation, DoneEvent, SourceCard, StreamEvent,
+    citation_event, error_event, source_event, text_event, tool_call_event
+)
 from pdf_processor import pdf_processor
+from conversation_store import conversation_store
 
 class GeminiClient:
     def __init__(self):
@@ -11,83 +13,84 @@ class GeminiClient:
         if not api_key:
             raise ValueError("GEMINI_API_KEY environment variable not set")
         
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.api_key = api_key
+        self._model = None
+    
+    @property
+    def model(self):
+        """Gemini model handle, imported and configured on first use"""
+        if self._model is None:
+            import google.generativeai as genai
+            
+            genai.configure(api_key=self.api_key)
+            self._model = genai.GenerativeModel('gemini-1.5-flash')
+        return self._model
         
     async def generate_response_stream(
         self,
         query: str,
-        available_documents: List[str]
-    ) -> AsyncGenerator[Dict, None]:
+        available_documents: List[str],
+        conversation_id: str = None
+    ) -> AsyncGenerator[StreamEvent, None]:
         """
-        Generate streaming response with citations from Gemini API
+        Generate streaming response with citations from Gemini API.
+        Context and history are carried over between turns of a conversation.
         """
+        # Calls without a conversation get a throwaway store so nothing is kept for them
+        store = conversation_store if conversation_id else conversation_store.detached()
         
         # Step 1: Emit tool call for searching documents
-        yield {
-            "event": "tool_call",
-            "data": {
-                "toolCall": {
-                    "id": "tc-1",
-                    "name": "search_documents",
-                    "status": "running",
-                    "description": "Searching available documents..."
-                }
-            }
-        }
+        yield tool_call_event(
+            "tc-1",
+            "search_documents",
+            "running",
+            "Searching available documents..."
+        )
+        
+        # First use parses PDFs; do that off the event loop
+        await pdf_processor.ensure_loaded(available_documents)
         
-        # Load PDF content for context
-        pdf_contexts = []
-        for doc_id in available_documents:
-            try:
-                text = pdf_processor.get_all_text(doc_id)
-                # Limit text to avoid token limits (take first 10000 chars per doc)
-                pdf_contexts.append({
-                    "document_id": doc_id,
-                    "title": doc_id.replace("_", " ").title(),
-                    "content": text[:10000]
-                })
-            except Exception as e:
-                print(f"Error loading {doc_id}: {e}")
+        # Retrieve relevant pages, reusing chunks already held by the conversation
+        turn = store.prepare_turn(conversation_id, query, available_documents)
+        pdf_contexts = turn["context"]
+        cited_chunks = turn["chunks"]
         
         # Complete search tool call
-        yield {
-            "event": "tool_call",
-            "data": {
-                "toolCall": {
-                    "id": "tc-1",
-                    "name": "search_documents",
-                    "status": "completed",
-                    "description": f"Found {len(pdf_contexts)} documents"
-                }
-            }
-        }
+        yield tool_call_event(
+            "tc-1",
+            "search_documents",
+            "completed",
+            f"Found {len(pdf_contexts)} relevant pages ({turn['new_chunks']} new)"
+        )
         
         # Step 2: Emit tool call for analyzing content
-        yield {
-            "event": "tool_call",
-            "data": {
-                "toolCall": {
-                    "id": "tc-2",
-                    "name": "analyze_content",
-                    "status": "running",
-                    "description": "Analyzing document content..."
-                }
-            }
-        }
+        yield tool_call_event(
+            "tc-2",
+            "analyze_content",
+            "running",
+            "Analyzing document content..."
+        )
         
         # Build prompt with PDF context
         context_text = "\n\n".join([
-            f"Document: {ctx['title']}\nContent:\n{ctx['content']}"
+            f"[{ctx['citation_id']}] Document: {ctx['title']} (page {ctx['page_number']})\nContent:\n{ctx['content']}"
             for ctx in pdf_contexts
         ])
         
+        history_text = "\n".join([
+            f"{message['role'].title()}: {message['content']}"
+            for message in turn["history"]
+        ])
+        
         prompt = f"""You are an AI assistant that answers questions based on provided documents. 
-When you reference information from a document, include an inline citation like [1], [2], etc.
+Each document excerpt is labelled with a number like [1], [2]. When you reference information from an excerpt, include its number as an inline citation.
 
 Available Documents:
 {context_text}
 
+Conversation So Far:
+{history_text or "(none)"}
+
 User Question: {query}
 
 Instructions:
@@ -99,20 +102,17 @@ Instructions:
 Answer:"""
         
         # Complete analyze tool call
-        yield {
-            "event": "tool_call",
-            "data": {
-                "toolCall": {
-                    "id": "tc-2",
-                    "name": "analyze_content",
-                    "status": "completed",
-                    "description": "Analysis complete"
-                }
-            }
-        }
+        yield tool_call_event(
+            "tc-2",
+            "analyze_content",
+            "completed",
+            "Analysis complete"
+        )
         
         # Step 3: Stream the response
         try:
+            import google.generativeai as genai
+            
             response = self.model.generate_content(
                 prompt,
                 stream=True,
@@ -131,12 +131,7 @@ Answer:"""
                     full_text += chunk.text
                     
                     # Yield text delta
-                    yield {
-                        "event": "text",
-                        "data": {
-                            "delta": chunk.text
-                        }
-                    }
+                    yield text_event(chunk.text)
                     
                     # Check for citation markers in accumulated text
                     # Simple heuristic: look for [1], [2], etc.
@@ -145,59 +140,49 @@ Answer:"""
                     
                     for match in citation_matches:
                         citation_num = int(match)
-                        if citation_num not in citations_added and citation_num <= len(pdf_contexts):
+                        if citation_num not in citations_added and citation_num in cited_chunks:
                             citations_added.add(citation_num)
                             
                             # Create citation from context
-                            ctx = pdf_contexts[citation_num - 1]
+                            ctx = cited_chunks[citation_num]
                             
                             # Extract a relevant excerpt (simplified - just take first 200 chars)
                             excerpt = ctx['content'][:200].strip() + "..."
                             
-                            yield {
-                                "event": "citation",
-                                "data": {
-                                    "citation": {
-                                        "id": citation_num,
-                                        "documentId": ctx['document_id'],
-                                        "documentTitle": ctx['title'],
-                                        "pageNumber": 1,  # Simplified - always page 1
-                                        "text": excerpt
-                                    }
-                                }
-                            }
+                            yield citation_event(Citation(
+                                id=citation_num,
+                                documentId=ctx['document_id'],
+                                documentTitle=ctx['title'],
+                                pageNumber=ctx['page_number'],
+                                text=excerpt
+                            ))
             
             # Step 4: Emit source cards for cited documents
             for citation_num in sorted(citations_added):
-                ctx = pdf_contexts[citation_num - 1]
+                ctx = cited_chunks[citation_num]
                 excerpt = ctx['content'][:200].strip() + "..."
                 
-                yield {
-                    "event": "source",
-                    "data": {
-                        "source": {
-                            "documentId": ctx['document_id'],
-                            "title": ctx['title'],
-                            "pageNumber": 1,
-                            "excerpt": excerpt
-                        }
-                    }
-                }
+                yield source_event(SourceCard(
+                    documentId=ctx['document_id'],
+                    title=ctx['title'],
+                    pageNumber=ctx['page_number'],
+                    excerpt=excerpt
+                ))
+            
+            store.add_turn(conversation_id, query, full_text, sorted(citations_added))
             
             # Step 5: Emit done event
-            yield {
-                "event": "done",
-                "data": {}
-            }
+            yield DoneEvent()
             
         except Exception as e:
-            yield {
-                "event": "error",
-                "data": {
-                    "error": "generation_failed",
-                    "message": str(e)
-                }
-            }
+            yield error_event("generation_failed", str(e))
+
+# Global instance, created on first use
+_gemini_client = None
 
-# Global instance
-gemini_client = GeminiClient()
+def get_gemini_client() -> GeminiClient:
+    """Get the shared Gemini client, creating it on first call"""
+    global _gemini_client
+    if _gemini_client is None:
+        _gemini_client = GeminiClient()
+    return _gemini_client
@@ -1,9 +1,11 @@
 import os
-from openai import OpenAI
-from typing import AsyncGenerator, Dict, List
-import json
-from models import Citation, SourceCard, ToolCall
+from typing import AsyncGenerator, List
+from models import (
+    Citation, DoneEvent, SourceCard, StreamEvent,
+    citation_event, error_event, source_event, text_event, tool_call_event
+)
 from pdf_processor import pdf_processor
+from conversation_store import conversation_store
 
 class GroqClient:
     def __init__(self):
@@ -12,86 +14,79 @@ class GroqClient:
         if not api_key:
             raise ValueError("GROK_API_KEY, XAI_API_KEY, or GROQ_API_KEY environment variable not set")
         
-        # Initialize OpenAI client with Groq's base URL
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url="https://api.groq.com/openai/v1"
-        )
+        self.api_key = api_key
+        self._client = None
         # Use Groq's fast models
         self.model = "llama-3.3-70b-versatile"  # Fast and capable model
+    
+    @property
+    def client(self):
+        """OpenAI SDK client, imported and constructed on first use"""
+        if self._client is None:
+            from openai import OpenAI
+            
+            # Initialize OpenAI client with Groq's base URL
+            self._client = OpenAI(
+                api_key=self.api_key,
+                base_url="https://api.groq.com/openai/v1"
+            )
+        return self._client
         
     async def generate_response_stream(
         self,
         query: str,
-        available_documents: List[str]
-    ) -> AsyncGenerator[Dict, None]:
+        available_documents: List[str],
+        conversation_id: str = None
+    ) -> AsyncGenerator[StreamEvent, None]:
         """
-        Generate streaming response with citations from Grok API
+        Generate streaming response with citations from Grok API.
+        Context and history are carried over between turns of a conversation.
         """
+        # Calls without a conversation get a throwaway store so nothing is kept for them
+        store = conversation_store if conversation_id else conversation_store.detached()
 
         import time
         timestamp = int(time.time() * 1000)  # milliseconds
         
-        yield {
-            "event": "tool_call",
-            "data": {
-                "toolCall": {
-                    "id": f"tc-search-{timestamp}",
-                    "name": "search_documents",
-                    "status": "running",
-                    "description": "Searching available documents..."
-                }
-            }
-        }
+        yield tool_call_event(
+            f"tc-search-{timestamp}",
+            "search_documents",
+            "running",
+            "Searching available documents..."
+        )
+        
+        # First use parses PDFs; do that off the event loop
+        await pdf_processor.ensure_loaded(available_documents)
         
-        # Load PDF content for context
-        pdf_contexts = []
-        for doc_id in available_documents:
-            try:
-                text = pdf_processor.get_all_text(doc_id)
-                # Limit text to avoid token limits (take first 10000 chars per doc)
-                pdf_contexts.append({
-                    "document_id": doc_id,
-                    "title": doc_id.replace("_", " ").title(),
-                    "content": text[:10000]
-                })
-            except Exception as e:
-                print(f"Error loading {doc_id}: {e}")
+        # Retrieve relevant pages, reusing chunks already held by the conversation
+        turn = store.prepare_turn(conversation_id, query, available_documents)
+        pdf_contexts = turn["context"]
+        cited_chunks = turn["chunks"]
         
         # Complete search tool call
-        yield {
-            "event": "tool_call",
-            "data": {
-                "toolCall": {
-                    "id": f"tc-search-{timestamp}",
-                    "name": "search_documents",
-                    "status": "completed",
-                    "description": f"Found {len(pdf_contexts)} documents"
-                }
-            }
-        }
+        yield tool_call_event(
+            f"tc-search-{timestamp}",
+            "search_documents",
+            "completed",
+            f"Found {len(pdf_contexts)} relevant pages ({turn['new_chunks']} new)"
+        )
         
         # Step 2: Emit tool call for analyzing content
-        yield {
-            "event": "tool_call",
-            "data": {
-                "toolCall": {
-                    "id": f"tc-analyze-{timestamp}",
-                    "name": "analyze_content",
-                    "status": "running",
-                    "description": "Analyzing document content..."
-                }
-            }
-        }
+        yield tool_call_event(
+            f"tc-analyze-{timestamp}",
+            "analyze_content",
+            "running",
+            "Analyzing document content..."
+        )
         
         # Build prompt with PDF context
         context_text = "\n\n".join([
-            f"Document: {ctx['title']}\nContent:\n{ctx['content']}"
+            f"[{ctx['citation_id']}] Document: {ctx['title']} (page {ctx['page_number']})\nContent:\n{ctx['content']}"
             for ctx in pdf_contexts
         ])
         
         system_prompt = """You are an AI assistant that answers questions based on provided documents. 
-When you reference information from a document, include an inline citation like [1], [2], etc.
+Each document excerpt is labelled with a number like [1], [2]. When you reference information from an excerpt, include its number as an inline citation.
 
 Instructions:
 1. Answer the question using information from the documents
@@ -107,17 +102,12 @@ User Question: {query}
 Answer:"""
         
         # Complete analyze tool call
-        yield {
-            "event": "tool_call",
-            "data": {
-                "toolCall": {
-                    "id": f"tc-analyze-{timestamp}",
-                    "name": "analyze_content",
-                    "status": "completed",
-                    "description": "Analysis complete"
-                }
-            }
-        }
+        yield tool_call_event(
+            f"tc-analyze-{timestamp}",
+            "analyze_content",
+            "completed",
+            "Analysis complete"
+        )
         
         # Step 3: Stream the response
         try:
@@ -128,6 +118,7 @@ Answer:"""
                 model=self.model,
                 messages=[
                     {"role": "system", "content": system_prompt},
+                    *turn["history"],
                     {"role": "user", "content": user_prompt}
                 ],
                 stream=True,
@@ -147,12 +138,7 @@ Answer:"""
                     full_text += delta
                     
                     # Yield text delta
-                    yield {
-                        "event": "text",
-                        "data": {
-                            "delta": delta
-                        }
-                    }
+                    yield text_event(delta)
                     
                     # Check for citation markers in accumulated text
                     # Simple heuristic: look for [1], [2], etc.
@@ -161,11 +147,11 @@ Answer:"""
                     
                     for match in citation_matches:
                         citation_num = int(match)
-                        if citation_num not in citations_added and citation_num <= len(pdf_contexts):
+                        if citation_num not in citations_added and citation_num in cited_chunks:
                             citations_added.add(citation_num)
                             
                             # Create citation from context
-                            ctx = pdf_contexts[citation_num - 1]
+                            ctx = cited_chunks[citation_num]
                             
                             # Try to find relevant excerpt by looking at text around the citation
                             # Find the sentence containing the citation marker
@@ -199,56 +185,46 @@ Answer:"""
                                             excerpt = "..." + ctx['content'][start:end].strip() + "..."
                                             break
                             
-                            yield {
-                                "event": "citation",
-                                "data": {
-                                    "citation": {
-                                        "id": citation_num,
-                                        "documentId": ctx['document_id'],
-                                        "documentTitle": ctx['title'],
-                                        "pageNumber": 1,  # Simplified - always page 1
-                                        "text": excerpt
-                                    }
-                                }
-                            }
+                            yield citation_event(Citation(
+                                id=citation_num,
+                                documentId=ctx['document_id'],
+                                documentTitle=ctx['title'],
+                                pageNumber=ctx['page_number'],
+                                text=excerpt
+                            ))
             
             print(f"[DEBUG] Received {chunk_count} chunks from Grok API")
             print(f"[DEBUG] Total text length: {len(full_text)}")
             
             # Step 4: Emit source cards for cited documents
             for citation_num in sorted(citations_added):
-                ctx = pdf_contexts[citation_num - 1]
+                ctx = cited_chunks[citation_num]
                 excerpt = ctx['content'][:200].strip() + "..."
                 
-                yield {
-                    "event": "source",
-                    "data": {
-                        "source": {
-                            "documentId": ctx['document_id'],
-                            "title": ctx['title'],
-                            "pageNumber": 1,
-                            "excerpt": excerpt
-                        }
-                    }
-                }
+                yield source_event(SourceCard(
+                    documentId=ctx['document_id'],
+                    title=ctx['title'],
+                    pageNumber=ctx['page_number'],
+                    excerpt=excerpt
+                ))
+            
+            store.add_turn(conversation_id, query, full_text, sorted(citations_added))
             
             # Step 5: Emit done event
-            yield {
-                "event": "done",
-                "data": {}
-            }
+            yield DoneEvent()
             
         except Exception as e:
             print(f"[ERROR] Grok API error: {type(e).__name__}: {str(e)}")
             import traceback
             traceback.print_exc()
-            yield {
-                "event": "error",
-                "data": {
-                    "error": "generation_failed",
-                    "message": str(e)
-                }
-            }
+            yield error_event("generation_failed", str(e))
+
+# Global instance, created on first use
+_groq_client = None
 
-# Global instance
-groq_client = GroqClient()
+def get_groq_client() -> GroqClient:
+    """Get the shared Groq client, creating it on first call"""
+    global _groq_client
+    if _groq_client is None:
+        _groq_client = GroqClient()
+    return _groq_client
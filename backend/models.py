@@ -1,5 +1,6 @@
 from pydantic import BaseModel
-from typing import List, Optional, Literal
+from typing import List, Optional, Literal, Union, get_args
+import msgspec
 
 # Request/Response models
 class ChatRequest(BaseModel):
@@ -10,8 +11,12 @@ class ChatResponse(BaseModel):
     jobId: str
     conversationId: str
 
+# Stream payloads are msgspec structs: slotted, cheap to build, and encoded
+# straight to JSON bytes. Leaf structs hold only scalars, so they skip GC tracking.
+# msgspec checks field types when decoding, not when a struct is constructed.
+
 # Citation model
-class Citation(BaseModel):
+class Citation(msgspec.Struct, omit_defaults=True, gc=False):
     id: int
     documentId: str
     documentTitle: str
@@ -21,7 +26,7 @@ class Citation(BaseModel):
     endIndex: Optional[int] = None
 
 # Source card model
-class SourceCard(BaseModel):
+class SourceCard(msgspec.Struct, omit_defaults=True, gc=False):
     documentId: str
     title: str
     pageNumber: int
@@ -29,32 +34,94 @@ class SourceCard(BaseModel):
     url: Optional[str] = None
 
 # Tool call model
-class ToolCall(BaseModel):
+ToolCallStatus = Literal['running', 'completed', 'failed']
+
+class ToolCall(msgspec.Struct, gc=False):
     id: str
     name: str
-    status: Literal['running', 'completed', 'failed']
+    status: ToolCallStatus
     description: str
 
+    def __post_init__(self):
+        # Clients build these from plain strings; catch a bad status before it is sent
+        if self.status not in get_args(ToolCallStatus):
+            raise ValueError(f"Invalid tool call status: {self.status!r}")
+
 # Stream event models
 StreamEventType = Literal['text', 'citation', 'tool_call', 'source', 'done', 'error']
 
-class StreamTextData(BaseModel):
+class StreamTextData(msgspec.Struct, omit_defaults=True, gc=False):
     text: Optional[str] = None
     delta: Optional[str] = None
 
-class StreamCitationData(BaseModel):
+class StreamCitationData(msgspec.Struct):
     citation: Citation
 
-class StreamToolCallData(BaseModel):
+class StreamToolCallData(msgspec.Struct):
     toolCall: ToolCall
 
-class StreamSourceData(BaseModel):
+class StreamSourceData(msgspec.Struct):
     source: SourceCard
 
-class StreamErrorData(BaseModel):
+class StreamErrorData(msgspec.Struct, gc=False):
     error: str
     message: str
 
-class StreamEvent(BaseModel):
-    event: StreamEventType
-    data: dict  # Will be one of the above data models
+class StreamDoneData(msgspec.Struct, gc=False):
+    pass
+
+# Each event type is tagged by its "event" field, so events encode to
+# {"event": "text", "data": {...}} exactly as the frontend expects
+class TextEvent(msgspec.Struct, tag_field="event", tag="text"):
+    data: StreamTextData
+
+class CitationEvent(msgspec.Struct, tag_field="event", tag="citation"):
+    data: StreamCitationData
+
+class ToolCallEvent(msgspec.Struct, tag_field="event", tag="tool_call"):
+    data: StreamToolCallData
+
+class SourceEvent(msgspec.Struct, tag_field="event", tag="source"):
+    data: StreamSourceData
+
+class DoneEvent(msgspec.Struct, tag_field="event", tag="done"):
+    data: StreamDoneData = msgspec.field(default_factory=StreamDoneData)
+
+class ErrorEvent(msgspec.Struct, tag_field="event", tag="error"):
+    data: StreamErrorData
+
+StreamEvent = Union[TextEvent, CitationEvent, ToolCallEvent, SourceEvent, DoneEvent, ErrorEvent]
+
+# Helpers so clients build events in one call
+def text_event(delta: str) -> TextEvent:
+    return TextEvent(StreamTextData(delta=delta))
+
+def citation_event(citation: Citation) -> CitationEvent:
+    return CitationEvent(StreamCitationData(citation))
+
+def tool_call_event(tool_call_id: str, name: str, status: ToolCallStatus, description: str) -> ToolCallEvent:
+    return ToolCallEvent(StreamToolCallData(ToolCall(tool_call_id, name, status, description)))
+
+def source_event(source: SourceCard) -> SourceEvent:
+    return SourceEvent(StreamSourceData(source))
+
+def error_event(error: str, message: str) -> ErrorEvent:
+    return ErrorEvent(StreamErrorData(error, message))
+
+_encoder = msgspec.json.Encoder()
+_decoder = msgspec.json.Decoder(StreamEvent)
+
+def encode_event(event: StreamEvent) -> bytes:
+    """Encode a stream event to JSON bytes"""
+    return _encoder.encode(event)
+
+def decode_event(data: bytes) -> StreamEvent:
+    """Decode and validate a stream event against the frontend contract"""
+    return _decoder.decode(data)
+
+def encode_sse(payload: msgspec.Struct, sse_event: str = "message", sep: bytes = b"\r\n") -> bytes:
+    """
+    Frame a struct as a complete SSE message. JSON output never contains
+    raw newlines, so the payload always fits on a single data line.
+    """
+    return b"".join((b"event: ", sse_event.encode(), sep, b"data: ", _encoder.encode(payload), sep, sep))
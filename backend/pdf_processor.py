@@ -1,14 +1,222 @@
-import pdfplumber
-from typing import Dict, List, Tuple
+from abc import ABC, abstractmethod
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import asyncio
+import json
+import math
 import os
+import re
+import struct
+import threading
+
+# Bump when the extracted page format changes so stale index files are rebuilt
+INDEX_VERSION = 4
+
+# Character boxes are stored as flat float32 runs of x0, top, x1, bottom;
+# NaN marks characters with no glyph (spaces, inserted newlines)
+BOX_FIELDS = 4
+NO_BOX = (math.nan,) * BOX_FIELDS
+
+# Boxes file header: magic, INDEX_VERSION, PDF size, PDF mtime_ns, number of boxes.
+# Readers check it against the pages they hold before trusting any offset.
+BOXES_MAGIC = b"BOXS"
+BOXES_HEADER = struct.Struct("<4sIqqq")
+
+# Words too common to help rank pages against a query
+STOPWORDS = {
+    "the", "and", "for", "are", "was", "were", "what", "which", "who", "how",
+    "why", "when", "where", "this", "that", "these", "those", "with", "from",
+    "about", "does", "did", "can", "could", "would", "should", "into", "its",
+    "their", "there", "them", "they", "you", "your", "has", "have", "had",
+    "not", "but", "all", "any", "more", "tell", "explain", "describe",
+}
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens used for page ranking"""
+    return [
+        token for token in re.findall(r"[a-z0-9]+", text.lower())
+        if len(token) > 2 and token not in STOPWORDS
+    ]
+
+def page_quality_issue(text: str) -> Optional[str]:
+    """
+    Return why extracted page text looks broken ("empty" or "garbled"),
+    or None if it looks usable.
+    """
+    visible = [c for c in text if not c.isspace()]
+    if not visible:
+        return "empty"
+    
+    # Replacement chars, control chars and private-use glyphs come from bad font maps
+    bad = sum(
+        1 for c in visible
+        if c == "\ufffd" or ord(c) < 32 or 0xE000 <= ord(c) <= 0xF8FF
+    )
+    readable = sum(1 for c in visible if c.isalnum())
+    if bad / len(visible) > 0.05 or readable / len(visible) < 0.5:
+        return "garbled"
+    return None
+
+def align_boxes(text: str, chars: Sequence[Tuple[str, Sequence[float]]]) -> array:
+    """
+    Match each character of text to a (char, box) pair in reading order.
+    Characters the extractor inserted (spaces, newlines) get no box.
+    """
+    boxes = array("f")
+    j = 0
+    for c in text:
+        if c.isspace():
+            boxes.extend(NO_BOX)
+            if j < len(chars) and chars[j][0].isspace():
+                j += 1
+            continue
+        
+        # Look a few characters ahead to step over glyphs the text dropped
+        match = None
+        for k in range(j, min(j + 8, len(chars))):
+            if chars[k][0] == c:
+                match = k
+                break
+        if match is None:
+            boxes.extend(NO_BOX)
+        else:
+            boxes.extend(chars[match][1])
+            j = match + 1
+    return boxes
+
+class ExtractionBackend(ABC):
+    """
+    Turns a PDF into per-page text with one bounding box per character.
+    Boxes are a flat array of x0, top, x1, bottom in PDF points from the
+    page's top-left, aligned with the page text (NO_BOX where there is no glyph).
+    """
+    name = "base"
+    
+    def is_available(self) -> bool:
+        return True
+    
+    @abstractmethod
+    def extract_pages(self, pdf_path: str, page_numbers: Optional[Sequence[int]] = None) -> List[Dict]:
+        """Extract the given 1-based pages, or every page if page_numbers is None"""
+    
+    def make_page(self, page_number: int, text: str, boxes: array, width: float, height: float) -> Dict:
+        return {
+            "page_number": page_number,
+            "text": text,
+            "char_count": len(text),
+            "width": round(width, 2),
+            "height": round(height, 2),
+            "boxes": boxes,
+            "backend": self.name
+        }
+
+class PyMuPDFBackend(ExtractionBackend):
+    """MuPDF (C) based extraction; much faster than pdfplumber"""
+    name = "pymupdf"
+    
+    def is_available(self) -> bool:
+        try:
+            import pymupdf
+        except ImportError:
+            return False
+        return True
+    
+    def extract_pages(self, pdf_path: str, page_numbers: Optional[Sequence[int]] = None) -> List[Dict]:
+        import pymupdf
+        
+        pages = []
+        with pymupdf.open(pdf_path) as doc:
+            numbers = page_numbers or range(1, doc.page_count + 1)
+            for page_num in numbers:
+                page = doc[page_num - 1]
+                text, boxes = self.read_page(page, pymupdf.TEXTFLAGS_RAWDICT & ~pymupdf.TEXT_PRESERVE_IMAGES)
+                pages.append(self.make_page(page_num, text, boxes, page.rect.width, page.rect.height))
+        return pages
+    
+    def read_page(self, page, flags: int) -> Tuple[str, array]:
+        """Build page text from raw glyphs so every character keeps its box"""
+        lines_text = []
+        boxes = array("f")
+        for block in page.get_text("rawdict", flags=flags)["blocks"]:
+            if block.get("type") != 0:
+                continue
+            for line in block["lines"]:
+                line_text = []
+                line_boxes = array("f")
+                for span in line["spans"]:
+                    for char in span["chars"]:
+                        line_text.append(char["c"])
+                        line_boxes.extend(NO_BOX if char["c"].isspace() else char["bbox"])
+                if line_text:
+                    if lines_text:
+                        boxes.extend(NO_BOX)  # the joining newline
+                    lines_text.append("".join(line_text))
+                    boxes.extend(line_boxes)
+        return "\n".join(lines_text), boxes
+
+class PdfplumberBackend(ExtractionBackend):
+    """pdfminer based extraction; slow but tolerant of unusual PDFs"""
+    name = "pdfplumber"
+    
+    def is_available(self) -> bool:
+        try:
+            import pdfplumber
+        except ImportError:
+            return False
+        return True
+    
+    def extract_pages(self, pdf_path: str, page_numbers: Optional[Sequence[int]] = None) -> List[Dict]:
+        import pdfplumber
+        
+        pages = []
+        with pdfplumber.open(pdf_path) as pdf:
+            numbers = page_numbers or range(1, len(pdf.pages) + 1)
+            for page_num in numbers:
+                page = pdf.pages[page_num - 1]
+                text = page.extract_text() or ""
+                chars = [
+                    (char["text"], (char["x0"], char["top"], char["x1"], char["bottom"]))
+                    for char in page.chars
+                ]
+                pages.append(self.make_page(page_num, text, align_boxes(text, chars), page.width, page.height))
+        return pages
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (PyMuPDFBackend(), PdfplumberBackend())
+}
+
+def get_backend(name: str) -> ExtractionBackend:
+    """Get an extraction backend by name, falling back to pdfplumber if it isn't installed"""
+    backend = BACKENDS.get(name)
+    if backend is None:
+        raise ValueError(f"Unknown PDF extraction backend: {name}")
+    if not backend.is_available():
+        print(f"PDF backend {name} not installed, using pdfplumber")
+        return BACKENDS["pdfplumber"]
+    return backend
 
 class PDFProcessor:
-    def __init__(self, pdf_directory: str = "sample_pdfs"):
+    def __init__(
+        self,
+        pdf_directory: str = "sample_pdfs",
+        index_directory: str = None,
+        backend: str = None,
+        fallback_backend: str = "pdfplumber"
+    ):
         self.pdf_directory = pdf_directory
+        self.index_directory = index_directory or os.path.join(pdf_directory, ".index")
+        self.backend_name = backend or os.getenv("PDF_EXTRACTION_BACKEND", "pymupdf")
+        self.fallback_backend_name = fallback_backend
         self.pdf_cache: Dict[str, Dict] = {}
+        self.term_cache: Dict[str, List[Counter]] = {}
+        # One lock per document so parsing one PDF never blocks readers of another
+        self.locks: Dict[str, threading.Lock] = {}
+        self.locks_guard = threading.Lock()
         
     def load_pdf(self, document_id: str) -> Dict:
-        """Load and cache PDF content"""
+        """Load and cache PDF content, preferring the on-disk index over parsing"""
         if document_id in self.pdf_cache:
             return self.pdf_cache[document_id]
         
@@ -16,24 +224,176 @@ class PDFProcessor:
         if not os.path.exists(pdf_path):
             raise FileNotFoundError(f"PDF not found: {document_id}")
         
-        pages_text = []
-        with pdfplumber.open(pdf_path) as pdf:
-            for page_num, page in enumerate(pdf.pages, start=1):
-                text = page.extract_text() or ""
-                pages_text.append({
-                    "page_number": page_num,
-                    "text": text,
-                    "char_count": len(text)
-                })
+        # Warm-up runs in a background thread; avoid parsing the same file twice
+        with self.get_lock(document_id):
+            if document_id in self.pdf_cache:
+                return self.pdf_cache[document_id]
+            
+            source = self.source_signature(pdf_path)
+            pdf_data = self.read_index(document_id, source)
+            if pdf_data is None:
+                pdf_data = self.extract_pdf(document_id, pdf_path)
+                # Boxes are only needed for highlights, so they live on disk, not in memory
+                page_boxes = [page.pop("boxes") for page in pdf_data["pages"]]
+                # An index without its boxes would serve empty highlights until the PDF changes
+                if self.write_boxes(document_id, source, page_boxes):
+                    self.write_index(document_id, source, pdf_data)
+            
+            # Remember which version of the PDF these pages came from
+            pdf_data["source"] = source
+            self.pdf_cache[document_id] = pdf_data
+        return pdf_data
+    
+    def extract_pdf(self, document_id: str, pdf_path: str) -> Dict:
+        """
+        Parse a PDF into per-page text with the fast backend, re-extracting
+        pages whose output looks broken with the fallback backend
+        """
+        # Backends import their parser lazily so worker boot doesn't pay for it
+        backend = get_backend(self.backend_name)
+        pages_text = backend.extract_pages(pdf_path)
         
-        pdf_data = {
+        broken = [page["page_number"] for page in pages_text if page_quality_issue(page["text"])]
+        fallback = BACKENDS.get(self.fallback_backend_name)
+        if broken and fallback and fallback.name != backend.name and fallback.is_available():
+            replacements = {
+                page["page_number"]: page
+                for page in fallback.extract_pages(pdf_path, broken)
+            }
+            for i, page in enumerate(pages_text):
+                replacement = replacements.get(page["page_number"])
+                if replacement is None:
+                    continue
+                # Keep the fallback if it fixed the page, or at least found some text
+                if not page_quality_issue(replacement["text"]) or (
+                    not page["text"].strip() and replacement["text"].strip()
+                ):
+                    pages_text[i] = replacement
+        
+        return {
             "document_id": document_id,
             "num_pages": len(pages_text),
             "pages": pages_text
         }
+    
+    def source_signature(self, pdf_path: str) -> Dict:
+        """Identify a PDF version by size and modification time"""
+        stat = os.stat(pdf_path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    
+    def get_index_path(self, document_id: str) -> str:
+        """Get full path to a PDF's index file"""
+        return os.path.join(self.index_directory, f"{document_id}.json")
+    
+    def read_index(self, document_id: str, source: Dict) -> Optional[Dict]:
+        """Load extracted pages from disk if the index matches the PDF"""
+        index_path = self.get_index_path(document_id)
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
         
-        self.pdf_cache[document_id] = pdf_data
-        return pdf_data
+        if index.get("version") != INDEX_VERSION or index.get("source") != source:
+            return None
+        return index.get("data")
+    
+    def write_index(self, document_id: str, source: Dict, pdf_data: Dict):
+        """Persist extracted pages so later workers skip parsing"""
+        index_path = self.get_index_path(document_id)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.index_directory, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "source": source, "data": pdf_data}, f)
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            print(f"Could not write index for {document_id}: {e}")
+    
+    def get_boxes_path(self, document_id: str) -> str:
+        """Get full path to a PDF's character boxes file"""
+        return os.path.join(self.index_directory, f"{document_id}.boxes")
+    
+    def write_boxes(self, document_id: str, source: Dict, page_boxes: List[array]) -> bool:
+        """Write every page's boxes back to back after a header; returns False on failure"""
+        boxes_path = self.get_boxes_path(document_id)
+        tmp_path = f"{boxes_path}.{os.getpid()}.tmp"
+        count = sum(len(boxes) for boxes in page_boxes) // BOX_FIELDS
+        try:
+            os.makedirs(self.index_directory, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(BOXES_HEADER.pack(
+                    BOXES_MAGIC, INDEX_VERSION, source["size"], source["mtime_ns"], count
+                ))
+                for boxes in page_boxes:
+                    boxes.tofile(f)
+            os.replace(tmp_path, boxes_path)
+        except OSError as e:
+            print(f"Could not write boxes for {document_id}: {e}")
+            return False
+        return True
+    
+    def read_boxes(self, document_id: str, source: Dict, total: int, offset: int, count: int) -> Optional[array]:
+        """
+        Read the boxes of count characters starting at character offset.
+        Returns None if the file is missing or was written for a different
+        version of the PDF than the caller's pages.
+        """
+        expected = (BOXES_MAGIC, INDEX_VERSION, source["size"], source["mtime_ns"], total)
+        boxes = array("f")
+        try:
+            with open(self.get_boxes_path(document_id), "rb") as f:
+                header = f.read(BOXES_HEADER.size)
+                if len(header) != BOXES_HEADER.size or BOXES_HEADER.unpack(header) != expected:
+                    return None
+                f.seek(BOXES_HEADER.size + offset * BOX_FIELDS * boxes.itemsize)
+                boxes.fromfile(f, count * BOX_FIELDS)
+        except (OSError, EOFError) as e:
+            print(f"Could not read boxes for {document_id}: {e}")
+            return None
+        return boxes
+    
+    def get_lock(self, document_id: str) -> threading.Lock:
+        with self.locks_guard:
+            lock = self.locks.get(document_id)
+            if lock is None:
+                lock = self.locks[document_id] = threading.Lock()
+            return lock
+    
+    async def ensure_loaded(self, document_ids: Iterable[str]):
+        """
+        Load any documents not yet in memory in a worker thread, so a first
+        use (or waiting on warm-up's parse) doesn't block the event loop
+        """
+        missing = [
+            doc_id for doc_id in document_ids
+            if doc_id not in self.pdf_cache or doc_id not in self.term_cache
+        ]
+        if missing:
+            await asyncio.to_thread(self.load_documents, missing)
+    
+    def load_documents(self, document_ids: Iterable[str]) -> int:
+        """Load PDFs and their term counts; returns the number loaded"""
+        loaded = 0
+        for doc_id in document_ids:
+            try:
+                self.load_pdf(doc_id)
+                self.get_page_terms(doc_id)
+                loaded += 1
+            except Exception as e:
+                print(f"Error loading {doc_id}: {e}")
+        return loaded
+    
+    def warm_up(self) -> int:
+        """
+        Load every available PDF into memory; returns the number loaded.
+        Raises if there were PDFs but none of them loaded.
+        """
+        document_ids = self.list_available_pdfs()
+        loaded = self.load_documents(document_ids)
+        if document_ids and not loaded:
+            raise RuntimeError(f"None of {len(document_ids)} PDFs could be loaded")
+        return loaded
     
     def get_all_text(self, document_id: str) -> str:
         """Get all text from PDF concatenated"""
@@ -66,6 +426,164 @@ class PDFProcessor:
                 return page["text"]
         return ""
     
+    def get_page_terms(self, document_id: str) -> List[Counter]:
+        """Get cached term counts for every page of a PDF"""
+        if document_id not in self.term_cache:
+            pdf_data = self.load_pdf(document_id)
+            self.term_cache[document_id] = [
+                Counter(tokenize(page["text"])) for page in pdf_data["pages"]
+            ]
+        return self.term_cache[document_id]
+    
+    def retrieve_chunks(
+        self,
+        query: str,
+        document_ids: Iterable[str],
+        top_k: int = 5,
+        max_chars: int = 4000
+    ) -> List[Dict]:
+        """
+        Rank pages across documents by query term overlap and return the
+        best ones as chunks. Pages that share no terms with the query are
+        never returned.
+        """
+        query_terms = set(tokenize(query))
+        if not query_terms:
+            return []
+        
+        scored = []
+        for doc_id in document_ids:
+            try:
+                page_terms = self.get_page_terms(doc_id)
+            except Exception as e:
+                print(f"Error loading {doc_id}: {e}")
+                continue
+            
+            pages = self.pdf_cache[doc_id]["pages"]
+            for page, terms in zip(pages, page_terms):
+                # Distinct query terms matter more than repeated ones
+                matched = [term for term in query_terms if term in terms]
+                if not matched:
+                    continue
+                score = len(matched) * 10 + sum(terms[term] for term in matched)
+                scored.append((score, doc_id, page))
+        
+        scored.sort(key=lambda item: item[0], reverse=True)
+        
+        return [
+            self.make_chunk(doc_id, page, max_chars, score)
+            for score, doc_id, page in scored[:top_k]
+        ]
+    
+    def leading_chunks(
+        self,
+        document_ids: Iterable[str],
+        max_chars: int = 4000
+    ) -> List[Dict]:
+        """First page of each document, used when retrieval finds nothing"""
+        chunks = []
+        for doc_id in document_ids:
+            try:
+                pdf_data = self.load_pdf(doc_id)
+            except Exception as e:
+                print(f"Error loading {doc_id}: {e}")
+                continue
+            if pdf_data["pages"]:
+                chunks.append(self.make_chunk(doc_id, pdf_data["pages"][0], max_chars))
+        return chunks
+    
+    def make_chunk(
+        self,
+        document_id: str,
+        page: Dict,
+        max_chars: int,
+        score: Optional[int] = None
+    ) -> Dict:
+        """Build a retrievable chunk from a page"""
+        return {
+            "chunk_id": f"{document_id}:{page['page_number']}",
+            "document_id": document_id,
+            "title": document_id.replace("_", " ").title(),
+            "page_number": page["page_number"],
+            "content": page["text"][:max_chars],
+            "score": score or 0
+        }
+    
+    def get_text_boxes(self, document_id: str, page_number: int, start: int, end: int) -> List[Dict]:
+        """
+        Highlight rectangles for page text[start:end], one per line,
+        merged from the per-character boxes
+        """
+        pdf_data = self.load_pdf(document_id)
+        # Pages are stored back to back, so a page's boxes start after all earlier characters
+        offset = 0
+        page = None
+        for p in pdf_data["pages"]:
+            if p["page_number"] == page_number:
+                page = p
+                break
+            offset += p["char_count"]
+        if page is None:
+            return []
+        
+        start = max(0, start)
+        end = min(end, page["char_count"])
+        if end <= start:
+            return []
+        total = sum(p["char_count"] for p in pdf_data["pages"])
+        boxes = self.read_boxes(document_id, pdf_data["source"], total, offset + start, end - start)
+        if boxes is None:
+            # The PDF changed under us; drop the stale pages so the next request reloads them
+            print(f"Boxes for {document_id} don't match the loaded pages, reloading")
+            self.pdf_cache.pop(document_id, None)
+            self.term_cache.pop(document_id, None)
+            return []
+        
+        rects: List[Dict] = []
+        for i in range(0, len(boxes), BOX_FIELDS):
+            x0, top, x1, bottom = boxes[i:i + BOX_FIELDS]
+            if math.isnan(x0):
+                continue
+            last = rects[-1] if rects else None
+            # Same line if the boxes overlap vertically by at least half their height
+            if last and min(last["bottom"], bottom) - max(last["top"], top) >= (bottom - top) / 2:
+                last["x0"] = min(last["x0"], x0)
+                last["x1"] = max(last["x1"], x1)
+                last["top"] = min(last["top"], top)
+                last["bottom"] = max(last["bottom"], bottom)
+            else:
+                rects.append({"x0": x0, "top": top, "x1": x1, "bottom": bottom})
+        return [{key: round(value, 2) for key, value in rect.items()} for rect in rects]
+    
+    def find_highlights(self, document_id: str, page_number: int, search_text: str) -> Optional[Dict]:
+        """Locate search_text on a page and return its highlight rectangles"""
+        pdf_data = self.load_pdf(document_id)
+        page = next((p for p in pdf_data["pages"] if p["page_number"] == page_number), None)
+        if page is None:
+            return None
+        
+        words = search_text.strip(". \n").split()
+        match = None
+        # Excerpts are cut mid-word, so retry without the partial words at each end
+        for candidate in (words, words[1:-1]):
+            if not candidate:
+                continue
+            pattern = r"\s+".join(re.escape(word) for word in candidate)
+            match = re.search(pattern, page["text"], re.IGNORECASE)
+            if match:
+                break
+        if match is None:
+            return None
+        
+        return {
+            "pageNumber": page_number,
+            "width": page.get("width"),
+            "height": page.get("height"),
+            "startIndex": match.start(),
+            "endIndex": match.end(),
+            "rects": self.get_text_boxes(document_id, page_number, match.start(), match.end())
+        }
+    
     def get_pdf_path(self, document_id: str) -> str:
         """Get full path to PDF file"""
         return os.path.join(self.pdf_directory, f"{document_id}.pdf")
@@ -0,0 +1,253 @@
+import asyncio
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import AsyncGenerator, Dict, List, Optional
+
+class StackSampler:
+    """Samples Python stacks from a background thread into collapsed-stack counts"""
+
+    def __init__(self, interval: float = 0.005, thread_id: Optional[int] = None):
+        self.interval = interval
+        # None samples every thread except the sampler itself
+        self.thread_id = thread_id
+        self.counts: Counter = Counter()
+        self.active = True
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            if not self.active:
+                continue
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if self.thread_id is not None and thread_id != self.thread_id:
+                    continue
+                self.counts[self._collapse(frame)] += 1
+
+    def _collapse(self, frame) -> str:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            filename = os.path.basename(code.co_filename)
+            stack.append(f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":"))
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+    def write_collapsed(self, path: str):
+        """Write counts in the collapsed format read by flamegraph.pl and speedscope"""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+class ProfileSession:
+    """
+    One CPU + allocation recording, written out as pstats, collapsed stacks
+    and a tracemalloc snapshot. Allocations are process-wide even for gated
+    sessions; the report lists net growth per line since the session started.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        profile_dir: str,
+        interval: float,
+        thread_id: Optional[int] = None,
+        gated: bool = False
+    ):
+        self.name = name
+        self.profile_dir = profile_dir
+        self.profiler = cProfile.Profile()
+        self.sampler = StackSampler(interval, thread_id)
+        # Gated sessions only record between resume() and pause()
+        self.sampler.active = not gated
+        self.started_tracemalloc = False
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+        self.started_at = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self.started_tracemalloc = True
+        self.baseline = self.take_snapshot()
+        self.sampler.start()
+
+    def take_snapshot(self) -> tracemalloc.Snapshot:
+        # Leave out tracemalloc's own bookkeeping
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__)
+        ])
+
+    def resume(self):
+        self.sampler.active = True
+        self.profiler.enable()
+
+    def pause(self):
+        self.profiler.disable()
+        self.sampler.active = False
+
+    def stop(self) -> Dict:
+        """Stop recording and write the reports; returns their file names"""
+        self.pause()
+        self.sampler.stop()
+        snapshot = self.take_snapshot()
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+
+        os.makedirs(self.profile_dir, exist_ok=True)
+        base = os.path.join(self.profile_dir, self.name)
+
+        self.profiler.dump_stats(f"{base}.prof")
+        self.sampler.write_collapsed(f"{base}.folded")
+        snapshot.dump(f"{base}.tracemalloc")
+
+        with open(f"{base}.allocations.txt", "w", encoding="utf-8") as f:
+            for stat in snapshot.compare_to(self.baseline, "lineno")[:50]:
+                f.write(f"{stat}\n")
+
+        return {
+            "name": self.name,
+            "duration_ms": round((time.perf_counter() - self.started_at) * 1000, 1),
+            "samples": sum(self.sampler.counts.values()),
+            "files": [
+                f"{self.name}.prof",
+                f"{self.name}.folded",
+                f"{self.name}.tracemalloc",
+                f"{self.name}.allocations.txt"
+            ]
+        }
+
+class ProfilingManager:
+    def __init__(self):
+        self.enabled = os.getenv("PROFILING_ENABLED", "0") == "1"
+        self.profile_dir = os.getenv("PROFILE_DIR", "profiles")
+        self.interval = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+        self.admin_token = os.getenv("ADMIN_TOKEN")
+        # Older profiles are deleted once more than this many have been recorded
+        self.max_reports = int(os.getenv("PROFILE_MAX_REPORTS", "20"))
+        # cProfile and tracemalloc are process-wide; record one session at a time
+        self.lock = threading.Lock()
+        self.active: Optional[ProfileSession] = None
+
+    def make_name(self, label: str) -> str:
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        return f"{timestamp}-{re.sub(r'[^A-Za-z0-9_-]', '_', label)}"
+
+    def start_session(
+        self,
+        label: str,
+        thread_id: Optional[int] = None,
+        gated: bool = False
+    ) -> Optional[ProfileSession]:
+        """Start a session, or return None if profiling is off or already running"""
+        if not self.enabled:
+            return None
+        with self.lock:
+            if self.active is not None:
+                print(f"Profiling busy, skipping {label}")
+                return None
+            self.active = ProfileSession(
+                self.make_name(label), self.profile_dir, self.interval, thread_id, gated
+            )
+        self.active.start()
+        return self.active
+
+    def finish_session(self, session: ProfileSession) -> Dict:
+        try:
+            report = session.stop()
+            print(f"Profile written: {report['files']}")
+            self.prune_reports()
+            return report
+        finally:
+            with self.lock:
+                self.active = None
+
+    async def profile_stream(
+        self,
+        label: str,
+        events: AsyncGenerator[bytes, None]
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        Profile a single job, recording only while it is producing an event.
+        That window includes its awaits, so other tasks the event loop runs
+        meanwhile (other requests' streams, timers) show up in the CPU data too.
+        """
+        session = self.start_session(label, threading.get_ident(), gated=True)
+        if session is None:
+            async for event in events:
+                yield event
+            return
+
+        try:
+            while True:
+                session.resume()
+                try:
+                    event = await events.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    session.pause()
+                yield event
+        finally:
+            self.finish_session(session)
+
+    async def profile_window(self, label: str, duration: float) -> Optional[Dict]:
+        """Profile the whole process for a fixed time window"""
+        session = self.start_session(label)
+        if session is None:
+            return None
+        # cProfile only sees the event loop thread; the sampler covers all threads
+        session.profiler.enable()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            report = self.finish_session(session)
+        return report
+
+    def list_reports(self) -> List[str]:
+        if not os.path.exists(self.profile_dir):
+            return []
+        return sorted(os.listdir(self.profile_dir), reverse=True)
+
+    def prune_reports(self):
+        """Delete the files of all but the newest max_reports profiles"""
+        # Every file of a profile shares its timestamped name up to the first dot
+        names = sorted({filename.split(".", 1)[0] for filename in self.list_reports()}, reverse=True)
+        stale = set(names[self.max_reports:])
+        for filename in self.list_reports():
+            if filename.split(".", 1)[0] in stale:
+                try:
+                    os.remove(os.path.join(self.profile_dir, filename))
+                except OSError as e:
+                    print(f"Could not remove old profile {filename}: {e}")
+
+    def get_report_path(self, filename: str) -> str:
+        """Resolve a report file name, refusing anything outside the profile directory"""
+        if os.path.basename(filename) != filename or filename.startswith("."):
+            raise FileNotFoundError(filename)
+        path = os.path.join(self.profile_dir, filename)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(filename)
+        return path
+
+# Global instance
+profiling_manager = ProfilingManager()
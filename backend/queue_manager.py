@@ -8,7 +8,7 @@ class JobQueue:
         self.jobs: Dict[str, Dict] = {}
         self.queue: asyncio.Queue = asyncio.Queue()
         
-    def create_job(self, query: str, conversation_id: str) -> str:
+    def create_job(self, query: str, conversation_id: str, profile: bool = False) -> str:
         """Create a new job and return job ID"""
         job_id = str(uuid.uuid4())
         
@@ -17,6 +17,7 @@ class JobQueue:
             "query": query,
             "conversation_id": conversation_id,
             "status": "pending",
+            "profile": profile,
             "created_at": datetime.now()
         }
         
@@ -26,6 +27,11 @@ class JobQueue:
         """Get job by ID"""
         return self.jobs.get(job_id)
     
+    def start_job(self, job_id: str):
+        """Mark a job as streaming"""
+        job = self.jobs[job_id]
+        job["status"] = "streaming"
+    
     def update_job_status(self, job_id: str, status: str):
         """Update job status"""
         if job_id in self.jobs:
@@ -1,22 +1,39 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from sse_starlette.sse import EventSourceResponse
-import json
+from starlette.background import BackgroundTask
+import asyncio
 import uuid
+from typing import Optional
 import os
 
 # Load environment variables FIRST before importing other modules
 from dotenv import load_dotenv
 load_dotenv()
 
-from models import ChatRequest, ChatResponse
-from grok_client import groq_client
+from models import ChatRequest, ChatResponse, StreamErrorData, encode_sse
+from grok_client import get_groq_client
 from pdf_processor import pdf_processor
 from queue_manager import job_queue
+from admission import AdmissionError, admission_controller, get_client_key
+from profiler import profiling_manager
+from warmup import warmup_manager
+from conversation_store import conversation_store
 
 app = FastAPI(title="AI Search Chat API")
 
+def load_llm_provider():
+    """Construct the provider client so the SDK import happens off the request path"""
+    client = get_groq_client()
+    client.client
+    return client.model
+
+# Heavy libraries and providers load on first use; warm-up does it ahead of traffic
+warmup_manager.register("llm_provider", load_llm_provider)
+warmup_manager.register("pdf_index", pdf_processor.warm_up)
+background_tasks = set()
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -26,6 +43,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_warmup():
+    """Start warm-up in the background so the worker accepts requests immediately"""
+    if os.getenv("WARMUP_ON_STARTUP", "1") == "0":
+        warmup_manager.disable()
+    else:
+        task = asyncio.create_task(warmup_manager.run())
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+@app.on_event("startup")
+async def start_lag_monitor():
+    """Track event-loop lag for load shedding"""
+    task = asyncio.create_task(admission_controller.monitor_loop_lag())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+@app.on_event("startup")
+async def start_conversation_cleanup():
+    """Expire idle conversations so the in-memory store doesn't grow without bound"""
+    task = asyncio.create_task(conversation_store.cleanup_loop())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+@app.exception_handler(AdmissionError)
+async def admission_error_handler(request: Request, exc: AdmissionError):
+    """Reject fast with 429/503 and tell the client when to retry"""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"error": exc.error, "message": exc.message},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 @app.get("/")
 async def read_root():
     return {
@@ -34,21 +84,62 @@ async def read_root():
         "endpoints": {
             "chat": "POST /api/chat",
             "stream": "GET /api/stream/{job_id}",
-            "pdf": "GET /api/pdf/{document_id}"
+            "pdf": "GET /api/pdf/{document_id}",
+            "health": "GET /health",
+            "ready": "GET /ready"
         }
     }
 
+@app.get("/health")
+async def health():
+    """
+    Liveness check; always succeeds once the app is serving
+    """
+    return {
+        "status": "ok",
+        "warmup": warmup_manager.get_status(),
+        "admission": admission_controller.get_stats()
+    }
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness check; 503 until warm-up has loaded every component
+    """
+    status = warmup_manager.get_status()
+    if not warmup_manager.is_ready():
+        return JSONResponse(status_code=503, content={"status": "not_ready", "warmup": status})
+    return {"status": "ready", "warmup": status}
+
 @app.post("/api/chat", response_model=ChatResponse)
-async def create_chat(request: ChatRequest):
+async def create_chat(
+    request: ChatRequest,
+    http_request: Request,
+    x_profile: Optional[str] = Header(None),
+    x_admin_token: Optional[str] = Header(None)
+):
     """
-    Create a new chat request and return job ID for streaming
+    Create a new chat request and return job ID for streaming.
+    Send `X-Profile: 1` to record a CPU/allocation profile of the job
+    (only honoured when PROFILING_ENABLED=1; needs the admin token if one is set).
     """
+    client_key = get_client_key(http_request.headers, http_request.client and http_request.client.host)
+    admission_controller.check_request(client_key)
+    
+    profile = x_profile == "1" and profiling_manager.enabled
+    if profile:
+        check_admin(x_admin_token)
+    
     try:
         # Generate conversation ID if not provided
         conversation_id = request.conversationId or str(uuid.uuid4())
         
         # Create job
-        job_id = job_queue.create_job(request.query, conversation_id)
+        job_id = job_queue.create_job(
+            request.query,
+            conversation_id,
+            profile=profile
+        )
         
         return ChatResponse(
             jobId=job_id,
@@ -58,7 +149,7 @@ async def create_chat(request: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/stream/{job_id}")
-async def stream_response(job_id: str):
+async def stream_response(job_id: str, http_request: Request):
     """
     Server-Sent Events endpoint for streaming AI responses
     """
@@ -67,9 +158,20 @@ async def stream_response(job_id: str):
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     
-
-
-    job_queue.update_job_status(job_id, "streaming")
+    # Each job streams once; replays would call the provider again for free
+    if job["status"] != "pending":
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+    
+    # Claim the job before waiting for a slot so concurrent requests can't both start it
+    job_queue.start_job(job_id)
+    
+    client_key = get_client_key(http_request.headers, http_request.client and http_request.client.host)
+    try:
+        slot = await admission_controller.acquire_stream(client_key)
+    except BaseException:
+        # Rejected or disconnected while queued; the client may retry later
+        job_queue.update_job_status(job_id, "pending")
+        raise
     
     async def event_generator():
         try:
@@ -78,41 +180,48 @@ async def stream_response(job_id: str):
             
             if not available_docs:
                 # Send error if no PDFs available
-                yield {
-                    "event": "error",
-                    "data": json.dumps({
-                        "error": "no_documents",
-                        "message": "No PDF documents available. Please add PDFs to the sample_pdfs directory."
-                    })
-                }
+                yield encode_sse(StreamErrorData(
+                    "no_documents",
+                    "No PDF documents available. Please add PDFs to the sample_pdfs directory."
+                ), "error")
+                job_queue.update_job_status(job_id, "failed")
                 return
             
             # Stream response from Groq
-            async for event in groq_client.generate_response_stream(
+            if not warmup_manager.is_component_ready("llm_provider"):
+                # First use imports and builds the SDK client; keep that off the event loop
+                await asyncio.to_thread(load_llm_provider)
+                warmup_manager.mark_ready("llm_provider")
+            client = get_groq_client()
+            await pdf_processor.ensure_loaded(available_docs)
+            if any(doc_id in pdf_processor.pdf_cache for doc_id in available_docs):
+                warmup_manager.mark_ready("pdf_index")
+            
+            async for event in client.generate_response_stream(
                 job["query"],
-                available_docs
+                available_docs,
+                job["conversation_id"]
             ):
-                # Convert event to SSE format
-                yield {
-                    "event": "message",
-                    "data": json.dumps(event)
-                }
+                # Encode straight to SSE bytes; EventSourceResponse sends bytes as-is
+                yield encode_sse(event)
             
             # Update job status
             job_queue.update_job_status(job_id, "completed")
             
         except Exception as e:
             print(f"Streaming error: {e}")
-            yield {
-                "event": "error",
-                "data": json.dumps({
-                    "error": "stream_failed",
-                    "message": str(e)
-                })
-            }
+            yield encode_sse(StreamErrorData("stream_failed", str(e)), "error")
             job_queue.update_job_status(job_id, "failed")
+        finally:
+            slot.release()
     
-    return EventSourceResponse(event_generator())
+    events = event_generator()
+    if job.get("profile"):
+        events = profiling_manager.profile_stream(f"job-{job_id}", events)
+    
+    # A generator closed before its first step never runs its finally, so
+    # also release from the background task; release() is idempotent
+    return EventSourceResponse(events, background=BackgroundTask(slot.release))
 
 @app.get("/api/pdf/{document_id}")
 async def get_pdf(document_id: str):
@@ -135,6 +244,22 @@ async def get_pdf(document_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/pdf/{document_id}/highlights")
+async def get_highlights(document_id: str, page: int, text: str):
+    """
+    Exact highlight rectangles (PDF points, top-left origin) for text on a page
+    """
+    try:
+        highlights = pdf_processor.find_highlights(document_id, page, text)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="PDF not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if highlights is None:
+        raise HTTPException(status_code=404, detail="Text not found on page")
+    return highlights
+
 @app.get("/api/documents")
 async def list_documents():
     """
@@ -154,6 +279,52 @@ async def list_documents():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def check_admin(x_admin_token: Optional[str]):
+    """Profiling endpoints exist only when enabled and, if configured, need the admin token"""
+    if not profiling_manager.enabled:
+        raise HTTPException(status_code=404, detail="Not found")
+    if profiling_manager.admin_token and x_admin_token != profiling_manager.admin_token:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.post("/api/admin/profile")
+async def start_profile(duration: float = 10.0, x_admin_token: Optional[str] = Header(None)):
+    """
+    Record a process-wide profile for `duration` seconds in the background
+    """
+    check_admin(x_admin_token)
+    if duration <= 0 or duration > 300:
+        raise HTTPException(status_code=400, detail="duration must be between 0 and 300 seconds")
+    if profiling_manager.active is not None:
+        raise HTTPException(status_code=409, detail="A profile is already being recorded")
+    
+    task = asyncio.create_task(profiling_manager.profile_window("window", duration))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return {"status": "recording", "duration": duration}
+
+@app.get("/api/admin/profiles")
+async def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """
+    List recorded profile reports
+    """
+    check_admin(x_admin_token)
+    return {
+        "recording": profiling_manager.active.name if profiling_manager.active else None,
+        "reports": profiling_manager.list_reports()
+    }
+
+@app.get("/api/admin/profiles/{filename}")
+async def get_profile(filename: str, x_admin_token: Optional[str] = Header(None)):
+    """
+    Download a profile report (.prof, .folded, .tracemalloc or .allocations.txt)
+    """
+    check_admin(x_admin_token)
+    try:
+        path = profiling_manager.get_report_path(filename)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=filename)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
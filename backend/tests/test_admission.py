@@ -0,0 +1,171 @@
+import asyncio
+
+import pytest
+
+import admission
+from admission import AdmissionController, AdmissionError, TokenBucket, get_client_key
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(admission.time, "monotonic", clock.monotonic)
+    return clock
+
+@pytest.fixture
+def controller():
+    controller = AdmissionController()
+    controller.rate_per_minute = 60
+    controller.burst = 2
+    controller.max_streams_per_client = 1
+    controller.max_active_streams = 2
+    controller.max_stream_wait_ms = 50
+    controller.max_queue_wait_ms = 1000
+    controller.min_wait_clients = 2
+    return controller
+
+def test_token_bucket_refills_over_time(clock):
+    bucket = TokenBucket(rate=1.0, capacity=2)
+
+    assert bucket.try_acquire() == (True, 0.0)
+    assert bucket.try_acquire() == (True, 0.0)
+    allowed, wait = bucket.try_acquire()
+    assert not allowed
+    assert wait == pytest.approx(1.0)
+
+    clock.now += 1.0
+    assert bucket.try_acquire()[0]
+
+def test_token_bucket_never_exceeds_capacity(clock):
+    bucket = TokenBucket(rate=1.0, capacity=2)
+    clock.now += 100
+    bucket.refill()
+    assert bucket.tokens == 2
+
+def test_check_request_rate_limits_per_client(controller, clock):
+    controller.check_request("a")
+    controller.check_request("a")
+    with pytest.raises(AdmissionError) as exc:
+        controller.check_request("a")
+    assert exc.value.status_code == 429
+    assert exc.value.retry_after == 1
+
+    # Another client has its own bucket
+    controller.check_request("b")
+
+def test_per_client_stream_cap_and_release(controller):
+    async def run():
+        slot = await controller.acquire_stream("a")
+        with pytest.raises(AdmissionError) as exc:
+            await controller.acquire_stream("a")
+        assert exc.value.status_code == 429
+
+        slot.release()
+        slot.release()  # idempotent
+        assert controller.streams == {}
+        assert controller.active_streams == 0
+
+        await controller.acquire_stream("a")
+
+    asyncio.run(run())
+
+def test_stream_queues_for_global_slot(controller):
+    async def run():
+        first = await controller.acquire_stream("a")
+        await controller.acquire_stream("b")
+
+        async def free_later():
+            await asyncio.sleep(0.01)
+            first.release()
+
+        asyncio.create_task(free_later())
+        await controller.acquire_stream("c")
+        assert controller.active_streams == 2
+
+        with pytest.raises(AdmissionError) as exc:
+            await controller.acquire_stream("d")
+        assert exc.value.status_code == 503
+        # The rejected client's reservation is rolled back
+        assert "d" not in controller.streams
+
+    asyncio.run(run())
+
+def test_freed_slot_goes_to_oldest_waiter(controller):
+    controller.max_active_streams = 1
+    controller.max_stream_wait_ms = 300
+
+    async def run():
+        held = await controller.acquire_stream("a")
+        queued = asyncio.create_task(controller.acquire_stream("b"))
+        await asyncio.sleep(0)
+
+        # New arrivals compete for every freed slot but must queue behind "b"
+        late = asyncio.create_task(controller.acquire_stream("c"))
+        await asyncio.sleep(0)
+        held.release()
+        assert controller.active_streams == 1
+
+        slot = await queued
+        assert not late.done()
+        slot.release()
+        (await late).release()
+        assert controller.active_streams == 0
+        assert not controller.slot_waiters
+
+    asyncio.run(run())
+
+def test_timed_out_waiter_leaves_the_queue(controller):
+    controller.max_active_streams = 1
+
+    async def run():
+        held = await controller.acquire_stream("a")
+        with pytest.raises(AdmissionError) as exc:
+            await controller.acquire_stream("b")
+        assert exc.value.status_code == 503
+        assert not controller.slot_waiters
+
+        held.release()
+        assert controller.active_streams == 0
+
+    asyncio.run(run())
+
+def test_one_client_cannot_trigger_shedding(controller):
+    controller.record_queue_wait("a", 60000)
+    assert controller.get_queue_wait_ms() == 0.0
+    controller.check_request("b")
+
+    # Waits are capped at the longest a stream can queue
+    controller.record_queue_wait("b", 60000)
+    assert controller.get_queue_wait_ms() == controller.max_stream_wait_ms
+
+def test_sheds_when_many_clients_wait(controller):
+    controller.max_queue_wait_ms = 10
+    for client_key in ("a", "b", "c"):
+        controller.record_queue_wait(client_key, 40)
+
+    with pytest.raises(AdmissionError) as exc:
+        controller.check_request("d")
+    assert exc.value.status_code == 503
+    assert exc.value.retry_after >= 1
+
+def test_queue_waits_expire(controller, clock):
+    controller.max_queue_wait_ms = 10
+    for client_key in ("a", "b"):
+        controller.record_queue_wait(client_key, 40)
+    clock.now += controller.window_seconds + 1
+    assert controller.get_queue_wait_ms() == 0.0
+
+def test_client_key_ignores_untrusted_header(monkeypatch):
+    monkeypatch.setattr(admission, "TRUSTED_PROXIES", {"10.0.0.1"})
+    monkeypatch.setattr(admission, "CLIENT_KEYS", {"issued"})
+
+    assert get_client_key({"x-client-key": "made-up"}, "1.2.3.4") == "1.2.3.4"
+    assert get_client_key({"x-client-key": "issued"}, "1.2.3.4") == "key:issued"
+    assert get_client_key({"x-client-key": "anyone"}, "10.0.0.1") == "key:anyone"
+    assert get_client_key({}, None) == "unknown"
@@ -0,0 +1,78 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import conversation_store as conversation_store_module
+from conversation_store import ConversationStore, estimate_tokens
+from pdf_processor import PDFProcessor
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "eval", "corpus")
+DOCUMENTS = ["solar_energy", "sourdough_baking", "tide_pools"]
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        conversation_store_module, "pdf_processor", PDFProcessor(CORPUS_DIR, index_directory=str(tmp_path))
+    )
+    return ConversationStore(top_k=3)
+
+def citation_ids(turn):
+    return {chunk["chunk_id"]: chunk["citation_id"] for chunk in turn["context"]}
+
+def test_citation_numbers_are_stable_across_turns(store):
+    first = store.prepare_turn("c", "How efficient are crystalline silicon modules?", DOCUMENTS)
+    assert first["new_chunks"] == len(first["chunks"]) > 0
+
+    second = store.prepare_turn("c", "Which direction should solar panels face?", DOCUMENTS)
+    assert second["new_chunks"] == len(second["chunks"]) - len(first["chunks"])
+    for chunk_id, citation_id in citation_ids(first).items():
+        assert store.conversations["c"]["chunk_ids"][chunk_id] == citation_id
+
+    repeat = store.prepare_turn("c", "How efficient are crystalline silicon modules?", DOCUMENTS)
+    assert repeat["new_chunks"] == 0
+    assert {k: v for k, v in citation_ids(repeat).items() if k in citation_ids(first)} == citation_ids(first)
+
+def test_follow_up_without_keywords_reuses_last_citations(store):
+    first = store.prepare_turn("c", "How long does bulk fermentation take?", DOCUMENTS)
+    last = store.conversations["c"]["last_citations"]
+
+    follow_up = store.prepare_turn("c", "tell me more", DOCUMENTS)
+    assert follow_up["new_chunks"] == 0
+    assert store.conversations["c"]["last_citations"] == last
+    assert [chunk["citation_id"] for chunk in follow_up["context"]] == sorted(last)
+    assert follow_up["context"] == first["context"]
+
+def test_history_summarizes_then_drops_old_turns():
+    store = ConversationStore(max_history_tokens=100, summary_chars=40)
+    answer = "This answer sentence is long enough to matter. " * 5  # ~58 tokens
+    for i in range(8):
+        store.add_turn("c", f"question {i}", answer, [])
+
+    messages = store.history_messages("c")
+    answers = [m["content"] for m in messages if m["role"] == "assistant"]
+    questions = [m["content"] for m in messages if m["role"] == "user"]
+
+    # The latest turn is kept whole, older ones are summarized, the oldest dropped
+    assert answers[-1] == answer
+    assert all(a.endswith("...") and len(a) <= 43 for a in answers[:-1])
+    assert questions[-1] == "question 7"
+    assert "question 0" not in questions
+    assert sum(estimate_tokens(m["content"]) for m in messages) <= 100
+
+def test_cleanup_drops_idle_conversations():
+    store = ConversationStore()
+    store.add_turn("old", "q", "a", [])
+    store.add_turn("recent", "q", "a", [])
+    store.conversations["old"]["updated_at"] = datetime.now() - timedelta(hours=2)
+
+    store.cleanup_old_conversations(3600)
+    assert list(store.conversations) == ["recent"]
+
+def test_detached_store_keeps_settings_but_not_conversations():
+    store = ConversationStore(top_k=3)
+    scratch = store.detached()
+    scratch.add_turn(None, "q", "a", [])
+
+    assert scratch.top_k == 3
+    assert store.conversations == {}
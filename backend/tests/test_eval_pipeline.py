@@ -0,0 +1,8 @@
+from eval_pipeline import percentile
+
+def test_percentile_is_nearest_rank():
+    assert percentile(list(range(1, 11)), 50) == 5
+    assert percentile(list(range(1, 101)), 99) == 99
+    assert percentile(list(range(1, 101)), 100) == 100
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([], 99) == 0.0
@@ -0,0 +1,15 @@
+import pytest
+
+from models import ToolCallEvent, decode_event, encode_event, tool_call_event
+
+def test_tool_call_event_round_trips():
+    event = tool_call_event("tc-1", "search_documents", "running", "Searching...")
+    assert encode_event(event) == (
+        b'{"event":"tool_call","data":{"toolCall":{"id":"tc-1","name":"search_documents",'
+        b'"status":"running","description":"Searching..."}}}'
+    )
+    assert isinstance(decode_event(encode_event(event)), ToolCallEvent)
+
+def test_tool_call_event_rejects_unknown_status():
+    with pytest.raises(ValueError):
+        tool_call_event("tc-1", "search_documents", "done", "Searching...")
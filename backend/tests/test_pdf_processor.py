@@ -0,0 +1,145 @@
+import asyncio
+import os
+import shutil
+import threading
+import time
+from array import array
+
+import pytest
+
+import pdf_processor
+from pdf_processor import ExtractionBackend, PDFProcessor, page_quality_issue
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "eval", "corpus")
+
+@pytest.fixture
+def processor(tmp_path):
+    return PDFProcessor(CORPUS_DIR, index_directory=str(tmp_path))
+
+def test_index_is_reused(processor, tmp_path):
+    pages = processor.load_pdf("tide_pools")["pages"]
+
+    reloaded = PDFProcessor(CORPUS_DIR, index_directory=str(tmp_path))
+    reloaded.extract_pdf = lambda *args: pytest.fail("should load from the index")
+    assert reloaded.load_pdf("tide_pools")["pages"] == pages
+
+def test_parsing_one_document_does_not_block_another(processor):
+    started = threading.Event()
+    extract_pdf = processor.extract_pdf
+
+    def slow_extract(document_id, pdf_path):
+        if document_id == "solar_energy":
+            started.set()
+            time.sleep(0.5)
+        return extract_pdf(document_id, pdf_path)
+
+    processor.extract_pdf = slow_extract
+    worker = threading.Thread(target=processor.load_pdf, args=("solar_energy",))
+    worker.start()
+    started.wait()
+
+    start = time.perf_counter()
+    processor.load_pdf("tide_pools")
+    assert time.perf_counter() - start < 0.4
+    worker.join()
+
+def test_ensure_loaded_runs_off_the_event_loop(processor):
+    loop_threads = []
+
+    def record_thread(document_ids):
+        loop_threads.append(threading.get_ident())
+        return PDFProcessor.load_documents(processor, document_ids)
+
+    processor.load_documents = record_thread
+
+    async def run():
+        await processor.ensure_loaded(["tide_pools"])
+        await processor.ensure_loaded(["tide_pools"])  # already cached: no thread hop
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert len(loop_threads) == 1
+    assert loop_threads[0] != loop_thread
+    assert "tide_pools" in processor.term_cache
+
+def test_highlight_boxes_stay_on_disk(processor):
+    highlight = processor.find_highlights("tide_pools", 2, "abandoned snail shells")
+    assert len(highlight["rects"]) == 1
+    assert "boxes" not in processor.pdf_cache["tide_pools"]["pages"][0]
+
+    reloaded = PDFProcessor(CORPUS_DIR, index_directory=processor.index_directory)
+    assert reloaded.find_highlights("tide_pools", 2, "abandoned snail shells") == highlight
+
+def test_highlights_ignore_boxes_from_a_replaced_pdf(tmp_path):
+    pdf_dir = tmp_path / "pdfs"
+    pdf_dir.mkdir()
+    shutil.copy(os.path.join(CORPUS_DIR, "tide_pools.pdf"), pdf_dir / "doc.pdf")
+    index_dir = str(tmp_path / "index")
+
+    stale = PDFProcessor(str(pdf_dir), index_directory=index_dir)
+    stale.load_pdf("doc")
+
+    # Another worker rebuilds the index after the PDF is replaced
+    shutil.copy(os.path.join(CORPUS_DIR, "solar_energy.pdf"), pdf_dir / "doc.pdf")
+    PDFProcessor(str(pdf_dir), index_directory=index_dir).load_pdf("doc")
+
+    assert stale.find_highlights("doc", 2, "abandoned snail shells")["rects"] == []
+    assert "doc" not in stale.pdf_cache
+    assert stale.find_highlights("doc", 2, "converts the direct current")["rects"]
+
+def test_index_is_not_written_without_boxes(processor):
+    processor.write_boxes = lambda *args: False
+    processor.load_pdf("tide_pools")
+    assert not os.path.exists(processor.get_index_path("tide_pools"))
+
+def test_page_quality_issue():
+    assert page_quality_issue("Solar panels convert sunlight.") is None
+    assert page_quality_issue(" \n ") == "empty"
+    assert page_quality_issue("\ufffd\ufffd\ufffd text") == "garbled"
+    assert page_quality_issue("%$#@ !&*( )_+") == "garbled"
+
+class StubBackend(ExtractionBackend):
+    def __init__(self, name, texts):
+        self.name = name
+        self.texts = texts
+        self.requested = None
+
+    def extract_pages(self, pdf_path, page_numbers=None):
+        self.requested = page_numbers
+        numbers = page_numbers or range(1, len(self.texts) + 1)
+        return [self.make_page(n, self.texts[n - 1], array("f"), 612, 792) for n in numbers]
+
+def test_fallback_only_replaces_pages_it_improves(processor, monkeypatch):
+    primary = StubBackend("primary", [
+        "A readable first page.",
+        "",  # empty: fallback finds garbled text, still better
+        "\ufffd\ufffd\ufffd broken",  # garbled: fallback fixes it
+        "\ufffd\ufffd\ufffd broken",  # garbled: fallback is no better, keep ours
+    ])
+    fallback = StubBackend("fallback", [
+        "unused",
+        "\ufffd\ufffd partial",
+        "A repaired third page.",
+        "",
+    ])
+    monkeypatch.setitem(pdf_processor.BACKENDS, "primary", primary)
+    monkeypatch.setitem(pdf_processor.BACKENDS, "fallback", fallback)
+    processor.backend_name = "primary"
+    processor.fallback_backend_name = "fallback"
+
+    pages = processor.extract_pdf("doc", "doc.pdf")["pages"]
+    assert fallback.requested == [2, 3, 4]
+    assert [(page["backend"], page["text"]) for page in pages] == [
+        ("primary", "A readable first page."),
+        ("fallback", "\ufffd\ufffd partial"),
+        ("fallback", "A repaired third page."),
+        ("primary", "\ufffd\ufffd\ufffd broken"),
+    ]
+
+def test_warm_up_fails_when_no_pdf_loads(tmp_path):
+    (tmp_path / "broken.pdf").write_bytes(b"not a pdf")
+    processor = PDFProcessor(str(tmp_path), index_directory=str(tmp_path / "index"))
+
+    with pytest.raises(RuntimeError):
+        processor.warm_up()
+    assert PDFProcessor(str(tmp_path / "empty")).warm_up() == 0
@@ -0,0 +1,13 @@
+from profiler import ProfilingManager
+
+def test_prune_keeps_newest_reports(tmp_path):
+    manager = ProfilingManager()
+    manager.profile_dir = str(tmp_path)
+    manager.max_reports = 2
+    for name in ("20260101-000001-a", "20260101-000002-b", "20260101-000003-c"):
+        for ext in ("prof", "folded", "tracemalloc", "allocations.txt"):
+            (tmp_path / f"{name}.{ext}").write_text("")
+
+    manager.prune_reports()
+    assert {f.split(".", 1)[0] for f in manager.list_reports()} == {"20260101-000002-b", "20260101-000003-c"}
+    assert len(manager.list_reports()) == 8
@@ -0,0 +1,41 @@
+import asyncio
+
+from warmup import WarmupManager
+
+def test_ready_after_all_components_load():
+    manager = WarmupManager()
+    manager.register("a", lambda: 1)
+    manager.register("b", lambda: None)
+    assert not manager.is_ready()
+
+    asyncio.run(manager.run())
+    assert manager.is_ready()
+    assert manager.get_status()["state"] == "ready"
+    assert manager.get_status()["components"]["a"]["detail"] == "1"
+
+def test_failed_component_is_degraded_until_loaded_on_use():
+    manager = WarmupManager()
+
+    def fail():
+        raise ValueError("no key")
+
+    manager.register("provider", fail)
+    asyncio.run(manager.run())
+    assert not manager.is_ready()
+    assert manager.get_status()["state"] == "degraded"
+
+    manager.mark_ready("provider")
+    assert manager.is_ready()
+
+def test_disabled_warmup_is_ready():
+    manager = WarmupManager()
+    manager.register("provider", lambda: None)
+    manager.disable()
+
+    assert manager.is_ready()
+    status = manager.get_status()
+    assert status["state"] == "disabled"
+    assert status["components"]["provider"]["status"] == "lazy"
+
+    manager.mark_ready("provider")
+    assert manager.get_status()["components"]["provider"]["status"] == "ready"
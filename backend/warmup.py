@@ -0,0 +1,91 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Callable, Dict
+
+class WarmupManager:
+    def __init__(self):
+        self.components: Dict[str, Dict] = {}
+        self.started_at = None
+        self.finished_at = None
+        # With warm-up disabled components load lazily on first use
+        self.enabled = True
+
+    def register(self, name: str, loader: Callable[[], object]):
+        """Register a blocking loader to run during warm-up"""
+        self.components[name] = {
+            "loader": loader,
+            "status": "pending",
+            "duration_ms": None,
+            "detail": None
+        }
+
+    async def run(self):
+        """Run every registered loader in a worker thread, one at a time"""
+        self.started_at = datetime.now()
+
+        for name, component in self.components.items():
+            component["status"] = "loading"
+            start = time.perf_counter()
+            try:
+                result = await asyncio.to_thread(component["loader"])
+                component["status"] = "ready"
+                if result is not None:
+                    component["detail"] = str(result)
+            except Exception as e:
+                print(f"Warm-up of {name} failed: {e}")
+                component["status"] = "failed"
+                component["detail"] = str(e)
+            component["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+        self.finished_at = datetime.now()
+
+    def disable(self):
+        """Skip warm-up; components load on first use and the worker is ready at once"""
+        self.enabled = False
+        for component in self.components.values():
+            if component["status"] == "pending":
+                component["status"] = "lazy"
+
+    def mark_ready(self, name: str):
+        """Record that a component finished loading outside warm-up"""
+        component = self.components.get(name)
+        if component and component["status"] in ("pending", "lazy", "failed"):
+            component["status"] = "ready"
+            component["detail"] = "loaded on first use"
+
+    def is_component_ready(self, name: str) -> bool:
+        component = self.components.get(name)
+        return bool(component) and component["status"] == "ready"
+
+    def is_ready(self) -> bool:
+        """True once every component has loaded, or immediately when warm-up is disabled"""
+        if not self.enabled:
+            return True
+        return all(c["status"] == "ready" for c in self.components.values())
+
+    def get_status(self) -> Dict:
+        """Warm-up state for health and readiness endpoints"""
+        if not self.enabled:
+            state = "disabled"
+        elif self.finished_at or self.is_ready():
+            state = "ready" if self.is_ready() else "degraded"
+        elif self.started_at:
+            state = "warming"
+        else:
+            state = "pending"
+
+        return {
+            "state": state,
+            "components": {
+                name: {
+                    "status": c["status"],
+                    "duration_ms": c["duration_ms"],
+                    "detail": c["detail"]
+                }
+                for name, c in self.components.items()
+            }
+        }
+
+# Global instance
+warmup_manager = WarmupManager()